@@ -22,3 +22,5 @@ VersionInfo = namedtuple('VersionInfo', 'major minor micro releaselevel serial')
 VERSION_INFO = VersionInfo(major=0, minor=11, micro=0, releaselevel='beta', serial=0)
 
 DWARF_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+default_app_config = 'dwarf.apps.DwarfConfig'
@@ -0,0 +1,119 @@
+"""Batched accounting of the commands users invoke."""
+
+import asyncio
+import time
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .db import get_executor
+from .models import User
+
+
+class CommandAccountant:
+    """Counts the commands users invoke in memory and writes
+    the counts to the database in bulk when :meth:`flush` is called,
+    instead of saving a user after every single command.
+
+    Parameters
+    ----------
+    loop : Optional[asyncio.AbstractEventLoop]
+        The loop that awaits the database queries.
+
+    Attributes
+    ----------
+    flushes : int
+        How many times counts were written to the database.
+    last_flush_latency : float
+        How long (in seconds) the last flush took.
+    total_flush_latency : float
+        How long (in seconds) all flushes took in total.
+    """
+
+    def __init__(self, loop=None):
+        self.loop = asyncio.get_event_loop() if loop is None else loop
+        self.flushes = 0
+        self.last_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+        self._counts = Counter()
+
+    def record(self, user_id):
+        """Counts a command invoked by a user.
+
+        Parameters
+        ----------
+        user_id : int
+            The ID of the user who invoked the command.
+        """
+
+        self._counts[user_id] += 1
+
+    @property
+    def queue_depth(self):
+        """The number of commands that have not been written to the database yet."""
+
+        return sum(self._counts.values())
+
+    @property
+    def stats(self):
+        """Returns a dict describing the accountant's queue and flushes."""
+
+        return {
+            'queue_depth': self.queue_depth,
+            'pending_users': len(self._counts),
+            'flushes': self.flushes,
+            'last_flush_latency': self.last_flush_latency,
+            'average_flush_latency': self.total_flush_latency / self.flushes if self.flushes else 0.0,
+        }
+
+    async def flush(self):
+        """Writes the buffered command counts to the database and returns
+        the IDs of the users that were registered by doing so."""
+
+        if not self._counts:
+            return []
+
+        counts, self._counts = self._counts, Counter()
+        start = time.perf_counter()
+        try:
+            registered = await get_executor().run(self._write, counts, loop=self.loop)
+        except Exception:
+            # keep the counts so the next flush can write them
+            self._counts.update(counts)
+            raise
+        latency = time.perf_counter() - start
+        self.flushes += 1
+        self.last_flush_latency = latency
+        self.total_flush_latency += latency
+        return registered
+
+    @staticmethod
+    def _write(counts):
+        with transaction.atomic():
+            existing = set(User.objects.filter(id__in=counts).values_list('id', flat=True))
+
+            registered = [user_id for user_id in counts if user_id not in existing]
+            try:
+                with transaction.atomic():
+                    User.objects.bulk_create([User(id=user_id, command_count=counts[user_id])
+                                              for user_id in registered])
+            except IntegrityError:
+                # another process registered some of the users in the meantime,
+                # so find out which ones were actually registered by this flush
+                new_users, registered = registered, []
+                for user_id in new_users:
+                    _, created = User.objects.get_or_create(id=user_id,
+                                                            defaults={'command_count': counts[user_id]})
+                    if created:
+                        registered.append(user_id)
+                    else:
+                        existing.add(user_id)
+
+            # one UPDATE per distinct increment instead of one per user
+            by_increment = defaultdict(list)
+            for user_id in existing:
+                by_increment[counts[user_id]].append(user_id)
+            for increment, user_ids in by_increment.items():
+                User.objects.filter(id__in=user_ids).update(command_count=F('command_count') + increment)
+        return registered
@@ -1,5 +1,33 @@
+import sys
+
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.signals import request_started
+
+from .profiling import StartupBudgetExceeded, profiler
+
+if getattr(settings, 'DWARF_PROFILE_STARTUP', False):
+    profiler.enable()
+profiler.start('django setup')
+
+
+def finish_profiling(**kwargs):
+    # a web worker has started up once it handles its first request,
+    # which shouldn't fail because the worker started too slowly
+    request_started.disconnect(finish_profiling)
+    try:
+        profiler.finish()
+    except StartupBudgetExceeded as error:
+        print(str(error), file=sys.stderr)
 
 
 class DwarfConfig(AppConfig):
     name = 'dwarf'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        profiler.stop('django setup')
+        # the bot finishes profiling itself once it's connected to Discord
+        if profiler.enabled:
+            request_started.connect(finish_profiling)
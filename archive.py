@@ -0,0 +1,236 @@
+"""Archiving the messages a bot receives in batches."""
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+
+import discord
+from django.conf import settings
+from django.db import transaction
+
+from . import DWARF_ROOT
+from .db import get_executor
+from .models import Message
+from .registry import get_registry
+from .versions import model_versions
+
+log = logging.getLogger('dwarf.archive')
+
+
+class MessageArchiver:
+    """Stores the messages sent in the guilds a bot is in, including
+    edits and deletions, by queueing them and writing them to the
+    database in batches.
+
+    When the queue is full, new events are either dropped or
+    appended to a spill file that is replayed once the queue has
+    room again, depending on the ``DWARF_ARCHIVE_OVERFLOW`` setting.
+    The same applies to batches that can't be written to the database.
+    Spilled events are buffered and written to the file by a thread,
+    so the event loop doesn't wait for the disk. Events that can't be
+    written to the database during a replay stay on disk and are
+    replayed again later.
+
+    Parameters
+    ----------
+    bot
+        The bot whose messages are archived.
+
+    Attributes
+    ----------
+    batch_size : int
+        The maximum number of events written per batch.
+        Set by ``DWARF_ARCHIVE_BATCH_SIZE``, defaults to 500.
+    flush_interval : float
+        How long (in seconds) to wait for more events before writing a batch
+        that isn't full. Set by ``DWARF_ARCHIVE_FLUSH_INTERVAL``, defaults to 1.
+    overflow : str
+        Either ``'drop'`` or ``'spill'``. Set by ``DWARF_ARCHIVE_OVERFLOW``,
+        defaults to ``'drop'``.
+    spill_path : str
+        The file events are spilled to. Set by ``DWARF_ARCHIVE_SPILL_PATH``.
+    archived : int
+        How many events have been written to the database.
+    dropped : int
+        How many events were dropped because the queue was full
+        or they couldn't be written to the database.
+    spilled : int
+        How many events were spilled to disk because the queue was full
+        or they couldn't be written to the database.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.batch_size = getattr(settings, 'DWARF_ARCHIVE_BATCH_SIZE', 500)
+        self.flush_interval = getattr(settings, 'DWARF_ARCHIVE_FLUSH_INTERVAL', 1)
+        self.overflow = getattr(settings, 'DWARF_ARCHIVE_OVERFLOW', 'drop')
+        if self.overflow not in ('drop', 'spill'):
+            raise ValueError("DWARF_ARCHIVE_OVERFLOW must be either 'drop' or 'spill'")
+        self.spill_path = getattr(settings, 'DWARF_ARCHIVE_SPILL_PATH',
+                                  os.path.join(DWARF_ROOT, 'archive_spill.jsonl'))
+        self.queue = asyncio.Queue(maxsize=getattr(settings, 'DWARF_ARCHIVE_QUEUE_SIZE', 10000), loop=bot.loop)
+        self.archived = 0
+        self.dropped = 0
+        self.spilled = 0
+        self._spill_buffer = []
+        self._spill_writer = None
+        self._spill_lock = asyncio.Lock(loop=bot.loop)
+
+    @property
+    def stats(self):
+        """Returns a dict describing the archiver's queue."""
+
+        return {
+            'queue_depth': self.queue.qsize(),
+            'archived': self.archived,
+            'dropped': self.dropped,
+            'spilled': self.spilled,
+        }
+
+    @staticmethod
+    def _serialize(message):
+        return {
+            'id': message.id,
+            'user_id': message.author.id,
+            'channel_id': message.channel.id,
+            'guild_id': message.guild.id,
+            'content': message.content,
+            'clean_content': message.clean_content,
+        }
+
+    def _enqueue(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self._overflow([event])
+
+    def _overflow(self, events):
+        if self.overflow == 'spill':
+            self._spill_buffer.extend(json.dumps(event) + '\n' for event in events)
+            self.spilled += len(events)
+            if self._spill_writer is None or self._spill_writer.done():
+                self._spill_writer = self.bot.loop.create_task(self._write_spilled())
+        else:
+            self.dropped += len(events)
+
+    async def on_message(self, message):
+        if isinstance(message.channel, discord.TextChannel):
+            self._enqueue(['create', self._serialize(message)])
+
+    async def on_message_edit(self, _, message):
+        if isinstance(message.channel, discord.TextChannel):
+            self._enqueue(['edit', self._serialize(message)])
+
+    async def on_message_delete(self, message):
+        self._enqueue(['delete', {'id': message.id}])
+
+    async def run(self):
+        """Writes queued events to the database until cancelled."""
+
+        while True:
+            batch = [await self.queue.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(await asyncio.wait_for(self.queue.get(), self.flush_interval, loop=self.bot.loop))
+            except asyncio.TimeoutError:
+                pass
+            if not await self._write_batch(batch):
+                self._overflow(batch)
+
+            if self.queue.empty() and (os.path.exists(self.spill_path) or os.path.exists(self._replay_path)):
+                await self._replay_spilled()
+
+    async def _write_batch(self, batch):
+        try:
+            await get_executor().run(self._write, batch, loop=self.bot.loop)
+        except Exception:
+            log.exception("failed to archive %d message events", len(batch))
+            return False
+        self.archived += len(batch)
+        return True
+
+    @property
+    def _replay_path(self):
+        return self.spill_path + '.replaying'
+
+    async def _write_spilled(self):
+        async with self._spill_lock:
+            while self._spill_buffer:
+                lines, self._spill_buffer = self._spill_buffer, []
+                await self.bot.loop.run_in_executor(None, self._append_lines, self.spill_path, lines)
+
+    async def _replay_spilled(self):
+        async with self._spill_lock:
+            # the file of a replay that failed is replayed before newer events
+            if not os.path.exists(self._replay_path):
+                os.replace(self.spill_path, self._replay_path)
+
+        with open(self._replay_path, encoding='utf-8') as spill_file:
+            while True:
+                position = spill_file.tell()
+                lines = await self.bot.loop.run_in_executor(None, self._read_lines, spill_file, self.batch_size)
+                if not lines:
+                    break
+                if not await self._write_batch([json.loads(line) for line in lines]):
+                    # keep the events of this batch and the following ones
+                    await self.bot.loop.run_in_executor(None, self._keep_rest, spill_file, position,
+                                                        self._replay_path)
+                    return
+        os.remove(self._replay_path)
+
+    @staticmethod
+    def _append_lines(path, lines):
+        with open(path, 'a', encoding='utf-8') as spill_file:
+            spill_file.writelines(lines)
+
+    @staticmethod
+    def _read_lines(spill_file, count):
+        lines = []
+        while len(lines) < count:
+            line = spill_file.readline()
+            if not line:
+                break
+            lines.append(line)
+        return lines
+
+    @staticmethod
+    def _keep_rest(spill_file, position, path):
+        spill_file.seek(position)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as rest_file:
+            shutil.copyfileobj(spill_file, rest_file)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def _write(batch):
+        upserts = {}
+        deleted = set()
+        for kind, data in batch:
+            if kind == 'delete':
+                deleted.add(data['id'])
+            else:
+                # later events for the same message replace earlier ones
+                upserts[data['id']] = data
+
+        if upserts:
+            registry = get_registry()
+            registry.ensure_users({data['user_id'] for data in upserts.values()})
+            registry.ensure_channels({data['channel_id']: data['guild_id'] for data in upserts.values()})
+            registry.flush()
+
+        with transaction.atomic():
+            existing = set(Message.objects.filter(id__in=upserts).values_list('id', flat=True))
+            messages = [Message(id=data['id'], user_id=data['user_id'], channel_id=data['channel_id'],
+                                content=data['content'], clean_content=data['clean_content'],
+                                is_deleted=data['id'] in deleted)
+                        for data in upserts.values()]
+            Message.objects.bulk_create([message for message in messages if message.id not in existing],
+                                        ignore_conflicts=True)
+            Message.objects.bulk_update([message for message in messages if message.id in existing],
+                                        ['content', 'clean_content'], batch_size=500)
+            if deleted:
+                Message.objects.filter(id__in=deleted).update(is_deleted=True)
+        # bulk queries don't send signals
+        model_versions.bump(Message)
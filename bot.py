@@ -7,16 +7,23 @@ import os
 import sys
 import traceback
 import types
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 
 import aiohttp
 import discord
 from discord.ext import commands
 from django.conf import settings
 
-from . import strings, utils, __version__
+from . import partitions, strings, utils, __version__
+from .accounting import CommandAccountant
+from .archive import MessageArchiver
 from .controllers import BaseController
 from .core.controllers import CoreController
 from .models import User, Guild, Channel
+from .profiling import StartupBudgetExceeded, profiler
+from .registry import get_registry
+from .sync import GuildSynchronizer
 
 
 class CommandConflict(discord.ClientException):
@@ -34,12 +41,25 @@ class Bot(commands.Bot):
                          command_has_no_subcommands=strings.command_has_no_subcommands)
         self.base.cache.loop = self.loop
         self.core.cache.loop = self.loop
+        self.accountant = CommandAccountant(loop=self.loop)
+        self.synchronizer = GuildSynchronizer(self)
+        self.archiver = MessageArchiver(self) if getattr(settings, 'DWARF_ARCHIVE_MESSAGES', False) else None
 
         self.create_task(self.wait_for_restart)
         self.create_task(self.wait_for_shutdown)
         self.tasks = {}
         self.extra_tasks = {}
+        # extension name -> names of the extra tasks its cogs registered
+        self._extension_tasks = {}
+        # tasks remove_task cancelled, which must not be restarted
+        self._removed_tasks = weakref.WeakSet()
+        # extension name -> (event name, listener) pairs its setup function added
+        self._extension_listeners = {}
+        # groups _resolve_groups created because a command's name asked for them
+        self._implicit_groups = set()
         self._stopped = asyncio.Event(loop=self.loop)
+        self.startup_error = None
+        self._deferred_extensions = []
 
         user_agent = 'Dwarf (https://github.com/Dwarf-Community/Dwarf {0}) Python/{1} aiohttp/{2} discord.py/{3}'
         self.http.user_agent = user_agent.format(__version__, sys.version.split(maxsplit=1)[0],
@@ -75,15 +95,68 @@ class Bot(commands.Bot):
         input("\n")
 
     async def on_command_completion(self, ctx):
-        author = ctx.message.author
-        user = self.core.get_user(author)
-        user_already_registered = self.core.user_is_registered(user)
-        user.command_count += 1
-        user.save()
-        if not user_already_registered:
-            await author.send(strings.user_registered.format(author.name))
+        self.accountant.record(ctx.message.author.id)
+
+    async def flush_command_counts(self):
+        """Writes the buffered command counts to the database
+        and greets the users that were registered by doing so."""
+
+        for user_id in await self.accountant.flush():
+            user = self.get_user(user_id)
+            if user is not None:
+                try:
+                    await user.send(strings.user_registered.format(user.name))
+                except discord.HTTPException:
+                    pass
+
+    async def do_flush_command_counts(self):
+        interval = getattr(settings, 'DWARF_COMMAND_ACCOUNTING_INTERVAL', 10)
+        while True:
+            await asyncio.sleep(interval, loop=self.loop)
+            try:
+                await self.flush_command_counts()
+            except Exception as error:
+                traceback.print_exception(type(error), error, error.__traceback__, file=sys.stderr)
+
+    async def do_flush_entities(self):
+        interval = getattr(settings, 'DWARF_ENTITY_FLUSH_INTERVAL', 5)
+        registry = get_registry()
+        while True:
+            await asyncio.sleep(interval, loop=self.loop)
+            if registry.pending:
+                try:
+                    await self.core.db.run(registry.flush, loop=self.loop)
+                except Exception as error:
+                    traceback.print_exception(type(error), error, error.__traceback__, file=sys.stderr)
+
+    async def do_maintain_message_partitions(self):
+        if not getattr(settings, 'DWARF_MESSAGE_PARTITIONING', False):
+            return
+        interval = getattr(settings, 'DWARF_MESSAGE_PARTITION_INTERVAL', 3600)
+        while True:
+            try:
+                dropped = await self.core.db.run(partitions.maintain, loop=self.loop)
+                if dropped:
+                    print("Dropped expired message partitions: " + ", ".join(dropped))
+            except Exception as error:
+                traceback.print_exception(type(error), error, error.__traceback__, file=sys.stderr)
+            await asyncio.sleep(interval, loop=self.loop)
+
+    async def do_archive_messages(self):
+        if self.archiver is not None:
+            await self.archiver.run()
 
     async def on_ready(self):
+        profiler.stop('gateway connect')
+        try:
+            profiler.finish()
+        except StartupBudgetExceeded as error:
+            print(str(error))
+            self.startup_error = error
+            self.core.disable_restarting()
+            await self.logout()
+            return
+
         if self.core.get_owner_id() is None:
             await self.set_bot_owner()
 
@@ -119,7 +192,39 @@ class Bot(commands.Bot):
         print("\n------")
         self.core.enable_restarting()
 
+        if getattr(settings, 'DWARF_SYNC_GUILDS', True):
+            self.loop.create_task(self.sync_guilds())
+
+        if self._deferred_extensions:
+            await self.load_deferred_extensions()
+
+    async def on_guild_join(self, guild):
+        if getattr(settings, 'DWARF_SYNC_GUILDS', True):
+            await self.sync_guilds([guild])
+
+    async def sync_guilds(self, guilds=None):
+        """Synchronizes the database with the bot's guilds
+        using :class:`GuildSynchronizer`.
+
+        Parameters
+        ----------
+        guilds : Optional[iter of discord.Guild]
+            The guilds to synchronize. Defaults to all guilds the bot is in.
+        """
+
+        try:
+            await self.synchronizer.sync(guilds)
+        except Exception as error:
+            print("Failed to synchronize guilds:", file=sys.stderr)
+            traceback.print_exception(type(error), error, error.__traceback__, file=sys.stderr)
+
     async def logout(self):
+        # a failed flush mustn't keep the bot from shutting down
+        try:
+            await self.flush_command_counts()
+        except Exception as error:
+            print("Failed to write the command counts:", file=sys.stderr)
+            traceback.print_exception(type(error), error, error.__traceback__, file=sys.stderr)
         await super().logout()
         self.stop()
 
@@ -132,12 +237,9 @@ class Bot(commands.Bot):
 
         # cancel lingering tasks
         if self.tasks or self.extra_tasks:
-            tasks = set()
-            for task in self.tasks:
-                tasks.add(task)
-            for _, extra_tasks in self.extra_tasks:
-                for task in extra_tasks:
-                    tasks.add(task)
+            tasks = set(self.tasks.values())
+            for extra_tasks in self.extra_tasks.values():
+                tasks.update(extra_tasks)
             gathered = asyncio.gather(*tasks, loop=self.loop)
             gathered.add_done_callback(silence_gathered)
             gathered.cancel()
@@ -151,8 +253,13 @@ class Bot(commands.Bot):
         self.extra_events.clear()
         self.tasks.clear()
         self.extra_tasks.clear()
+        self._extension_tasks.clear()
+        self._removed_tasks.clear()
+        self._extension_listeners.clear()
+        self._implicit_groups.clear()
         self.cogs.clear()
         self.extensions.clear()
+        self._deferred_extensions.clear()
         self._stopped.clear()
         self._checks.clear()
         self._check_once.clear()
@@ -166,7 +273,9 @@ class Bot(commands.Bot):
         for name, member in members:
             # register tasks the cog has
             if name.startswith('do_'):
-                self.add_task(member, resume_check=self.core.restarting_enabled)
+                task_name = cog.extension + '.' + name
+                self.add_task(member, name=task_name, resume_check=self.core.restarting_enabled)
+                self._extension_tasks.setdefault(cog.extension, []).append(task_name)
 
         self._resolve_groups(cog)
 
@@ -201,6 +310,7 @@ class Bot(commands.Bot):
                     group_help = strings.group_help.format(group_name)
                     group_command = self.group(name=entire_group, invoke_without_command=True,
                                                help=group_help)(groupcmd)
+                    self._implicit_groups.add(group_command)
                     self._resolve_groups(group_command)
 
                 self.all_commands.pop(cog_or_command.name)
@@ -212,7 +322,10 @@ class Bot(commands.Bot):
 
     def create_task(self, coro, *args, resume_check=None, **kwargs):
         def actual_resume_check():
-            return resume_check() and not self.is_closed()
+            # runs inside the task, so the current task is the one being restarted
+            if asyncio.Task.current_task(loop=self.loop) in self._removed_tasks:
+                return False
+            return resume_check is not None and resume_check() and not self.is_closed()
 
         async def pause():
             if not self.is_ready():
@@ -259,12 +372,32 @@ class Bot(commands.Bot):
         name = coro.__name__ if name is None else name
 
         if name in self.extra_tasks:
-            if not unique:
-                self.extra_tasks[name].append(self.create_task(coro, resume_check))
-            else:
-                return
+            if unique:
+                return None
+            task = self.create_task(coro, resume_check=resume_check)
+            self.extra_tasks[name].append(task)
         else:
-            self.extra_tasks[name] = [coro]
+            task = self.create_task(coro, resume_check=resume_check)
+            self.extra_tasks[name] = [task]
+        return task
+
+    def remove_task(self, name):
+        """Cancels and unregisters the tasks registered under a name with :meth:`add_task`.
+        The tasks aren't restarted, regardless of their ``resume_check``.
+        Returns the cancelled tasks, which may still be running until
+        they handle the cancellation.
+
+        Parameters
+        -----------
+        name : str
+            The name the tasks were registered under.
+        """
+
+        tasks = self.extra_tasks.pop(name, [])
+        for task in tasks:
+            self._removed_tasks.add(task)
+            task.cancel()
+        return tasks
 
     async def wait_for_shutdown(self):
         await self.core.cache.subscribe('shutdown')
@@ -299,46 +432,248 @@ class Bot(commands.Bot):
         if name in self.extensions:
             return None
 
-        cog_module = importlib.import_module('dwarf.' + name + '.cogs')
+        return self._setup_extension(name, importlib.import_module('dwarf.' + name + '.cogs'))
 
+    def _setup_extension(self, name, cog_module):
         if hasattr(cog_module, 'setup'):
+            # remember the listeners setup adds, since no cog removes them on unload
+            listeners = {event: list(funcs) for event, funcs in self.extra_events.items()}
             cog_module.setup(self, name)
+            added = [(event, func) for event, funcs in self.extra_events.items()
+                     for func in funcs if all(func is not old for old in listeners.get(event, ()))]
+            if added:
+                self._extension_listeners[name] = added
         else:
-            cog_classes = inspect.getmembers(cog_module, lambda member: isinstance(member, type) and
-                                             issubclass(member, Cog) and member is not Cog)
+            cog_classes = inspect.getmembers(cog_module, lambda member: (isinstance(member, type)
+                                                                         and issubclass(member, Cog)
+                                                                         and member is not Cog))
+            if not cog_classes:
+                raise ImportError("The {} extension's cog module didn't have "
+                                  "any Cog subclass and no setup function".format(name))
             for _, _Cog in cog_classes:
-                if _Cog is None:
-                    raise ImportError("The {} extension's cog module didn't have "
-                                      "any Cog subclass and no setup function".format(name))
                 self.add_cog(_Cog(self, name))
 
         self.extensions[name] = cog_module
         return cog_module
 
-    def _load_cogs(self):
+    def unload_extension(self, name):
+        """Unloads an extension's cogs, including their commands,
+        listeners and tasks, and removes its modules from ``sys.modules``
+        so that loading it again imports its code again.
+        Tasks are cancelled, which ends their Pub/Sub subscriptions,
+        and returned, so callers can wait for them to finish.
+        Listeners added by the cog module's ``setup`` function are removed too.
+
+        Model modules are kept because Django can't register models twice,
+        so changes to models still need a restart.
+
+        Parameters
+        ----------
+        name : str
+            The name of the extension.
+        """
+
+        if name == 'core':
+            raise discord.ClientException("the core extension can't be unloaded")
+        if name not in self.extensions:
+            return []
+
+        tasks = []
+        for task_name in self._extension_tasks.pop(name, []):
+            tasks.extend(self.remove_task(task_name))
+        for event, func in self._extension_listeners.pop(name, []):
+            self.remove_listener(func, event)
+
+        for cog_name, cog in list(self.cogs.items()):
+            if getattr(cog, 'extension', None) != name:
+                continue
+            # commands moved into groups by _resolve_groups aren't removed by remove_cog
+            for _, member in inspect.getmembers(cog, lambda _member: isinstance(_member, commands.Command)):
+                if member.parent is not None:
+                    member.parent.remove_command(member.name)
+            self.remove_cog(cog_name)
+        self._remove_empty_groups()
+
+        del self.extensions[name]
+        prefix = 'dwarf.' + name
+        for module_name in list(sys.modules):
+            if ((module_name == prefix or module_name.startswith(prefix + '.'))
+                    and module_name != prefix + '.models'):
+                del sys.modules[module_name]
+        importlib.invalidate_caches()
+        return tasks
+
+    def reload_extension(self, name):
+        """Unloads an extension and loads its current code.
+        The old code's tasks may still be handling their cancellation
+        when the new code is loaded; use :meth:`areload_extension`
+        from a coroutine to wait for them.
+
+        Parameters
+        ----------
+        name : str
+            The name of the extension.
+        """
+
+        self.unload_extension(name)
+        return self.load_extension(name)
+
+    async def aunload_extension(self, name):
+        """Unloads an extension like :meth:`unload_extension`
+        and waits until its tasks have finished."""
+
+        tasks = self.unload_extension(name)
+        if tasks:
+            await asyncio.wait(tasks, loop=self.loop)
+
+    async def areload_extension(self, name):
+        """Unloads an extension, waits until its tasks have finished
+        and loads its current code."""
+
+        await self.aunload_extension(name)
+        return self.load_extension(name)
+
+    def _remove_empty_groups(self):
+        removed = True
+        while removed:
+            removed = False
+            for group in list(self._implicit_groups):
+                if group.commands:
+                    continue
+                if group.parent is not None:
+                    group.parent.remove_command(group.name)
+                else:
+                    self.remove_command(group.name)
+                self._implicit_groups.discard(group)
+                removed = True
+
+    @staticmethod
+    def _import_extension(name, concurrent=True):
+        """Imports an extension's package and cog module."""
+
+        # concurrent imports' allocations can't be told apart
+        with profiler.phase('import extension: ' + name, memory=not concurrent, extension=name):
+            package = importlib.import_module('dwarf.' + name)
+            cog_module = importlib.import_module('dwarf.' + name + '.cogs')
+        return getattr(package, 'deferred', False), cog_module
+
+    def _print_load_error(self, error):
+        if not settings.DEBUG:
+            print("{}: {}".format(error.__class__.__name__, str(error)))
+        else:
+            traceback.print_exception(type(error), error, error.__traceback__, file=sys.stderr)
+
+    async def _load_cogs(self):
+        """Loads the Core cog and the cogs of all installed extensions.
+
+        The cog modules are imported concurrently in worker threads (up to
+        ``DWARF_EXTENSION_LOAD_WORKERS``, defaults to 4), then set up one
+        after another so that every extension is set up after the extensions
+        it depends on. Extensions whose package sets ``deferred = True``, and
+        the extensions depending on them, are set up once the bot is ready
+        instead, so they don't hold up logging in.
+
+        Worker threads have no event loop, so modules that need one at import
+        time, for example to call ``asyncio.get_event_loop()`` or to create an
+        ``aiohttp.ClientSession``, fail to import there. Every extension whose
+        import failed in a worker thread is imported again on the event loop's
+        thread before it counts as failed.
+        """
+
         self.load_extension('core')
 
         core_cog = self.get_cog('Core')
         if core_cog is None:
             raise ImportError("Could not find the Core cog.")
 
+        extensions = [extension for extension in self.base.get_extensions() if extension not in self.extensions]
+        dependencies = self.base.get_dependencies()
         failed = []
-        extensions = self.base.get_extensions()
-        for extension in extensions:
-            try:
-                self.load_extension(extension)
-            except Exception as error:
-                if not settings.DEBUG:
-                    print("{}: {}".format(error.__class__.__name__, str(error)))
-                else:
-                    traceback.print_exception(type(error), error, error.__traceback__, file=sys.stderr)
+
+        executor = ThreadPoolExecutor(max_workers=getattr(settings, 'DWARF_EXTENSION_LOAD_WORKERS', 4))
+        try:
+            results = await asyncio.gather(*(self.loop.run_in_executor(executor, self._import_extension, extension)
+                                             for extension in extensions), loop=self.loop, return_exceptions=True)
+        finally:
+            executor.shutdown(wait=False)
+
+        imported = {}
+        deferred = set()
+        for extension, result in zip(extensions, results):
+            if isinstance(result, Exception):
+                try:
+                    result = self._import_extension(extension, concurrent=False)
+                except Exception as error:
+                    self._print_load_error(error)
+                    failed.append(extension)
+                    continue
+            is_deferred, imported[extension] = result
+            if is_deferred:
+                deferred.add(extension)
+
+        self._deferred_extensions = []
+        ordered, cyclic = self._dependency_order(list(imported), dependencies)
+        failed.extend(cyclic)
+        for extension in ordered:
+            _dependencies = [dependency for dependency in dependencies.get(extension, [])
+                             if dependency in extensions]
+            if any(dependency in failed or dependency not in imported for dependency in _dependencies):
+                print("{}: a dependency failed to load".format(extension))
                 failed.append(extension)
+            elif extension in deferred or any(dependency in deferred for dependency in _dependencies):
+                deferred.add(extension)
+                self._deferred_extensions.append((extension, imported[extension]))
+            else:
+                try:
+                    with profiler.phase('load extension: ' + extension, extension=extension):
+                        self._setup_extension(extension, imported[extension])
+                except Exception as error:
+                    self._print_load_error(error)
+                    failed.append(extension)
 
         if failed:
             print("\nFailed to load: " + ", ".join(failed))
 
         return core_cog
 
+    @staticmethod
+    def _dependency_order(extensions, dependencies):
+        """Orders extensions so that every extension comes after the ones it depends on.
+        Returns the ordered extensions and a list of the extensions caught in a dependency
+        cycle or depending on one, which are left out."""
+
+        ordered = []
+        remaining = set(extensions)
+        while remaining:
+            ready = [extension for extension in extensions if extension in remaining
+                     and not any(dependency in remaining for dependency in dependencies.get(extension, []))]
+            if not ready:
+                print("Dependency cycle between: " + ", ".join(sorted(remaining)))
+                break
+            ordered.extend(ready)
+            remaining.difference_update(ready)
+        return ordered, [extension for extension in extensions if extension in remaining]
+
+    async def load_deferred_extensions(self):
+        """Sets up the extensions that were deferred by :meth:`_load_cogs`."""
+
+        deferred, self._deferred_extensions = self._deferred_extensions, []
+        dependencies = self.base.get_dependencies()
+        failed = []
+        for extension, cog_module in deferred:
+            if any(dependency in failed for dependency in dependencies.get(extension, [])):
+                failed.append(extension)
+                continue
+            try:
+                with profiler.phase('load extension: ' + extension, extension=extension, deferred=True):
+                    self._setup_extension(extension, cog_module)
+            except Exception as error:
+                self._print_load_error(error)
+                failed.append(extension)
+
+        if failed:
+            print("Failed to load deferred extensions: " + ", ".join(failed))
+
     def task(self, unique=True, resume_check=None):
         """A decorator that registers a task to execute in the background.
 
@@ -386,7 +721,7 @@ class Bot(commands.Bot):
             if hasattr(self, name):
                 if unique:
                     return coro
-            setattr(self, name, self.create_task(coro, resume_check))
+            setattr(self, name, self.create_task(coro, resume_check=resume_check))
 
         return wrapped
 
@@ -536,7 +871,19 @@ class Bot(commands.Bot):
         print(strings.owner_recognized.format(data.owner.name))
 
     async def run(self, reconnect=True):
-        self._load_cogs()
+        if self.archiver is not None:
+            for event in ('on_message', 'on_message_edit', 'on_message_delete'):
+                self.add_listener(getattr(self.archiver, event), event)
+
+        # apply the schema changes of an upgrade before anything queries the tables
+        with profiler.phase('sync database'):
+            await self.base.async_database()
+
+        with profiler.phase('load extensions'):
+            await self._load_cogs()
+
+        with profiler.phase('redis connect'):
+            await self.base.cache.get_pool()
 
         if self.core.get_prefixes():
             self.command_prefix = list(self.core.get_prefixes())
@@ -550,7 +897,10 @@ class Bot(commands.Bot):
         print(strings.keep_updated.format(self.command_prefix[0]))
         print(strings.official_server.format(strings.invite_link))
 
-        await self.start(self.base.get_token(), reconnect=reconnect)
+        with profiler.phase('gateway login'):
+            await self.login(self.base.get_token())
+        profiler.start('gateway connect')
+        await self.connect(reconnect=reconnect)
 
         await self._stopped.wait()
 
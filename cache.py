@@ -1,10 +1,343 @@
 import asyncio
+import sys
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict, defaultdict
 
 import aioredis
+from aioredis.pubsub import Receiver
 from django.conf import settings
 from redis_cache import RedisCache
 
 
+class ConnectionPool:
+    """A pool of asynchronous Redis connections that is shared
+    by all :class:`Cache` objects using the same event loop.
+
+    Parameters
+    ----------
+    redis : aioredis.Redis
+        The pool-backed Redis client created by ``aioredis.create_redis_pool``.
+
+    Attributes
+    ----------
+    redis : aioredis.Redis
+        The pool-backed Redis client. Commands executed on it
+        acquire and release connections automatically.
+    acquisitions : int
+        How many times a connection was acquired using :meth:`acquire`.
+    wait_time : float
+        The total time (in seconds) spent waiting for a free connection.
+    max_wait_time : float
+        The longest time (in seconds) spent waiting for a free connection.
+    """
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.acquisitions = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def acquire(self):
+        """Returns an asynchronous context manager that acquires a
+        connection from the pool and releases it when exiting.
+
+        Example
+        -------
+
+        ::
+
+            async with pool.acquire() as redis:
+                await redis.publish('channel:restart', 1)
+        """
+
+        return _PooledConnection(self)
+
+    def _record_wait(self, wait_time):
+        self.acquisitions += 1
+        self.wait_time += wait_time
+        if wait_time > self.max_wait_time:
+            self.max_wait_time = wait_time
+
+    @property
+    def stats(self):
+        """Returns a dict describing the current state of the pool."""
+
+        pool = self.redis.connection
+        return {
+            'size': pool.size,
+            'minsize': pool.minsize,
+            'maxsize': pool.maxsize,
+            'in_use': pool.size - pool.freesize,
+            'idle': pool.freesize,
+            'acquisitions': self.acquisitions,
+            'wait_time': self.wait_time,
+            'average_wait_time': self.wait_time / self.acquisitions if self.acquisitions else 0.0,
+            'max_wait_time': self.max_wait_time,
+        }
+
+    @property
+    def closed(self):
+        return self.redis.closed
+
+    async def close(self):
+        self.redis.close()
+        await self.redis.wait_closed()
+
+
+class _PooledConnection:
+    def __init__(self, pool):
+        self._pool = pool
+        self._connection = None
+
+    async def __aenter__(self):
+        start = time.perf_counter()
+        self._connection = await self._pool.redis.connection.acquire()
+        self._pool._record_wait(time.perf_counter() - start)
+        return aioredis.Redis(self._connection)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._pool.redis.connection.release(self._connection)
+        self._connection = None
+
+
+class NearCache:
+    """An in-process LRU cache with a time-to-live that is kept
+    in front of Redis to serve repeated reads from memory.
+    Values are stored the way they are stored in Redis, so every hit
+    returns a fresh copy that callers may mutate freely.
+
+    Parameters
+    ----------
+    maxsize : int
+        The maximum number of keys kept in memory.
+    timeout : Optional[float]
+        After this amount of time (in seconds), a key is fetched from Redis again
+        even if no invalidation was received for it.
+
+    Attributes
+    ----------
+    hits : int
+        How many reads were served from memory.
+    misses : int
+        How many reads had to be served by Redis.
+    evictions : int
+        How many keys were dropped because the cache was full.
+    invalidations : int
+        How many keys were dropped because they were changed.
+    """
+
+    def __init__(self, maxsize=1024, timeout=60):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._data = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns a tuple of the raw value stored for `key` (or ``None``)
+        and a token that has to be passed to :meth:`set` after fetching
+        the value from Redis on a miss."""
+
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value, self._generation
+                del self._data[key]
+            self.misses += 1
+            return None, self._generation
+
+    def set(self, key, value, token):
+        """Stores a raw value fetched from Redis, unless a key
+        was invalidated since `token` was obtained from :meth:`get`."""
+
+        with self._lock:
+            if token != self._generation:
+                return
+            expires = time.monotonic() + self.timeout if self.timeout else None
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *keys):
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                if self._data.pop(key, None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    @property
+    def stats(self):
+        """Returns a dict of the cache's counters."""
+
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+
+class PubSubListener:
+    """Reads the messages of all Pub/Sub channels and patterns a process
+    is subscribed to from a single Redis connection and fans them out
+    to the queues of the subscribers.
+
+    Every subscriber gets a queue of limited size. The listener never
+    waits for a subscriber, so one that falls behind or stopped reading
+    can't hold up the others: once its queue is full, the oldest message
+    in it is dropped to make room for the new one.
+
+    Parameters
+    ----------
+    redis : aioredis.Redis
+        A dedicated Redis connection that is used for Pub/Sub only.
+    loop : asyncio.AbstractEventLoop
+        The loop the listener reads messages on.
+    queue_size : Optional[int]
+        The maximum number of unprocessed messages per subscriber.
+
+    Attributes
+    ----------
+    redis : aioredis.Redis
+        The Redis connection used for Pub/Sub.
+    """
+
+    def __init__(self, redis, loop, queue_size=100):
+        self.redis = redis
+        self.loop = loop
+        self.queue_size = queue_size
+        self._receiver = Receiver(on_close=lambda *args, **kwargs: None)
+        self._queues = defaultdict(set)
+        self._lock = asyncio.Lock(loop=loop)
+        self._reader = loop.create_task(self._read())
+
+    @property
+    def closed(self):
+        return self.redis.closed
+
+    @property
+    def subscriptions(self):
+        """Returns a dict mapping the channels and patterns the
+        listener is subscribed to to their number of subscribers."""
+
+        return {name: len(queues) for (name, _), queues in self._queues.items()}
+
+    async def subscribe(self, name, pattern=False):
+        """Subscribes to a channel or pattern and returns the
+        :class:`asyncio.Queue` the messages will be put into.
+        Messages received through a pattern are put into the queue as
+        tuples of the actual channel's name and the message.
+
+        Parameters
+        ----------
+        name : str
+            The name of the channel or the pattern.
+        pattern : Optional[bool]
+            Whether `name` is a pattern. Defaults to ``False``.
+        """
+
+        queue = asyncio.Queue(maxsize=self.queue_size, loop=self.loop)
+        async with self._lock:
+            queues = self._queues[(name, pattern)]
+            if not queues:
+                if pattern:
+                    await self.redis.psubscribe(self._receiver.pattern(name))
+                else:
+                    await self.redis.subscribe(self._receiver.channel(name))
+            queues.add(queue)
+        return queue
+
+    async def unsubscribe(self, name, queue, pattern=False):
+        """Removes a queue returned by :meth:`subscribe`. The listener
+        unsubscribes from the channel or pattern once it has no more queues.
+
+        Parameters
+        ----------
+        name : str
+            The name of the channel or the pattern.
+        queue : asyncio.Queue
+            The queue that should no longer receive messages.
+        pattern : Optional[bool]
+            Whether `name` is a pattern. Defaults to ``False``.
+        """
+
+        async with self._lock:
+            queues = self._queues.get((name, pattern))
+            if queues is None:
+                return
+            queues.discard(queue)
+            if not queues:
+                del self._queues[(name, pattern)]
+                if not self.closed:
+                    if pattern:
+                        await self.redis.punsubscribe(name)
+                    else:
+                        await self.redis.unsubscribe(name)
+
+    async def close(self):
+        self._reader.cancel()
+        self._receiver.stop()
+        self.redis.close()
+        await self.redis.wait_closed()
+
+    @staticmethod
+    def _deliver(queue, name, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            queue.get_nowait()
+            queue.put_nowait(message)
+            print("A subscriber of {} is falling behind, dropped its oldest message".format(name), file=sys.stderr)
+
+    async def _read(self):
+        closed = self.loop.create_task(self.redis.wait_closed())
+        try:
+            while not self.closed:
+                received = self.loop.create_task(self._receiver.get(encoding='utf-8'))
+                await asyncio.wait((received, closed), loop=self.loop, return_when=asyncio.FIRST_COMPLETED)
+                if not received.done():
+                    received.cancel()
+                    break
+                if received.result() is None:
+                    break
+                sender, message = received.result()
+                if sender.is_pattern:
+                    channel, message = message
+                    message = (channel.decode('utf-8'), message)
+                name = sender.name.decode('utf-8')
+                for queue in self._queues.get((name, sender.is_pattern), ()):
+                    self._deliver(queue, name, message)
+        finally:
+            closed.cancel()
+            # wake up all subscribers so they can notice the connection is gone
+            for queues in self._queues.values():
+                for queue in queues:
+                    try:
+                        queue.put_nowait(None)
+                    except asyncio.QueueFull:
+                        pass
+
+
 class Cache:
     """Represents a connection to the cache backend.
     This class is used to store keys into and retrieve keys
@@ -19,6 +352,10 @@ class Cache:
         using :meth:`publish` or :meth:`subscribe`.
     bot
         The bot used to dispatch subscription events.
+    near_cache : Optional[bool]
+        Whether reads should be served from the in-process
+        :class:`NearCache` when possible. Defaults to the
+        ``NEAR_CACHE`` key of ``DWARF_CACHE_BACKEND['redis']``.
 
     Attributes
     -----------
@@ -31,7 +368,20 @@ class Cache:
         The bot used to dispatch subscription events.
     """
 
-    def __init__(self, extension='', bot=None, loop=None):
+    # one connection pool per event loop, shared by all instances
+    _pools = weakref.WeakKeyDictionary()
+    _pool_locks = weakref.WeakKeyDictionary()
+    # one Pub/Sub listener per event loop, shared by all instances
+    _listeners = weakref.WeakKeyDictionary()
+
+    # the near cache and its invalidation listener are shared by the whole process
+    INVALIDATION_CHANNEL = 'channel:cache_invalidation'
+    _node_id = uuid.uuid4().hex
+    _near_cache = None
+    _near_cache_listener = None
+    _near_cache_lock = threading.Lock()
+
+    def __init__(self, extension='', bot=None, loop=None, near_cache=None):
         self.config = settings.DWARF_CACHE_BACKEND['redis']
         self.backend = RedisCache('{}:{}'.format(self.config['HOST'], self.config['PORT']),
                                   {'db': self.config['DB'], 'password': self.config['PASSWORD']})
@@ -41,9 +391,59 @@ class Cache:
             self.loop = bot.loop
         else:
             self.loop = loop
+        # writes always broadcast invalidations while the near cache is
+        # enabled, so that other processes never serve stale values
+        self._broadcast_invalidations = self.config.get('NEAR_CACHE', False)
+        if near_cache is None:
+            near_cache = self._broadcast_invalidations
+        self.near_cache = self._get_near_cache() if near_cache else None
+
+    def _get_near_cache(self):
+        cls = type(self)
+        with cls._near_cache_lock:
+            if cls._near_cache is None:
+                cls._near_cache = NearCache(maxsize=self.config.get('NEAR_CACHE_SIZE', 1024),
+                                            timeout=self.config.get('NEAR_CACHE_TIMEOUT', 60))
+            if cls._near_cache_listener is None or not cls._near_cache_listener.is_alive():
+                # a stale near cache can't be trusted after missing invalidations
+                cls._near_cache.clear()
+                pubsub = self.backend.get_client(None, write=True).pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(**{cls.INVALIDATION_CHANNEL: cls._on_invalidation})
+                cls._near_cache_listener = pubsub.run_in_thread(sleep_time=1, daemon=True)
+        return cls._near_cache
+
+    @classmethod
+    def _on_invalidation(cls, message):
+        node_id, _, keys = message['data'].decode('utf-8').partition('\n')
+        if node_id != cls._node_id and cls._near_cache is not None:
+            cls._near_cache.invalidate(*keys.split('\n'))
+
+    def _invalidate(self, *keys):
+        if self._near_cache is not None:
+            self._near_cache.invalidate(*keys)
+        if self._broadcast_invalidations:
+            self.backend.get_client(None, write=True).publish(
+                self.INVALIDATION_CHANNEL, self._node_id + '\n' + '\n'.join(keys))
+
+    async def _ainvalidate(self, *keys):
+        if self._near_cache is not None:
+            self._near_cache.invalidate(*keys)
+        if self._broadcast_invalidations:
+            pool = await self.get_pool()
+            await pool.redis.publish(self.INVALIDATION_CHANNEL, self._node_id + '\n' + '\n'.join(keys))
+
+    def get_near_cache_stats(self):
+        """Returns the hit, miss and eviction counters of the
+        in-process near cache as a dict, or ``None`` if it is disabled."""
+
+        if self._near_cache is None:
+            return None
+        return self._near_cache.stats
 
     async def get_async_redis(self, loop=None):
-        """Creates an asynchronous Redis connection.
+        """Creates a dedicated asynchronous Redis connection.
+        The caller is responsible for closing it; use :meth:`get_pool`
+        for commands that don't need a connection of their own.
 
         Parameters
         ----------
@@ -57,6 +457,111 @@ class Cache:
             'redis://{}:{}'.format(self.config['HOST'], self.config['PORT']),
             db=self.config['DB'], password=self.config['PASSWORD'], loop=loop)
 
+    async def get_pool(self, loop=None):
+        """Returns the :class:`ConnectionPool` shared by all :class:`Cache`
+        objects that use the same event loop, creating it if necessary.
+        The pool size is configured using the ``POOL_MINSIZE`` and
+        ``POOL_MAXSIZE`` keys of ``DWARF_CACHE_BACKEND['redis']``.
+
+        Parameters
+        ----------
+        loop = Optional[asyncio.AbstractEventLoop]
+            The loop used for the asynchronous Redis connections.
+        """
+
+        if loop is None:
+            loop = self.loop if self.loop is not None else asyncio.get_event_loop()
+
+        pool = self._pools.get(loop)
+        if pool is not None and not pool.closed:
+            return pool
+
+        lock = self._pool_locks.get(loop)
+        if lock is None:
+            lock = self._pool_locks[loop] = asyncio.Lock(loop=loop)
+
+        async with lock:
+            pool = self._pools.get(loop)
+            if pool is None or pool.closed:
+                redis = await aioredis.create_redis_pool(
+                    'redis://{}:{}'.format(self.config['HOST'], self.config['PORT']),
+                    db=self.config['DB'], password=self.config['PASSWORD'],
+                    minsize=self.config.get('POOL_MINSIZE', 1), maxsize=self.config.get('POOL_MAXSIZE', 10),
+                    loop=loop)
+                pool = self._pools[loop] = ConnectionPool(redis)
+        return pool
+
+    @classmethod
+    async def close_pool(cls, loop=None):
+        """Closes the connection pool and the Pub/Sub listener used on the given event loop.
+
+        Parameters
+        ----------
+        loop = Optional[asyncio.AbstractEventLoop]
+            The loop whose connection pool should be closed.
+        """
+
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        listener = cls._listeners.pop(loop, None)
+        if listener is not None and not listener.closed:
+            await listener.close()
+        pool = cls._pools.pop(loop, None)
+        if pool is not None and not pool.closed:
+            await pool.close()
+
+    def get_pool_stats(self, loop=None):
+        """Returns the metrics of the connection pool used on the given event loop
+        as a dict, or ``None`` if no pool has been created yet.
+
+        The dict contains the number of connections that are ``in_use`` and
+        ``idle``, as well as the total, average and maximum time spent waiting
+        for a free connection (in seconds).
+
+        Parameters
+        ----------
+        loop = Optional[asyncio.AbstractEventLoop]
+            The loop whose connection pool should be inspected.
+        """
+
+        if loop is None:
+            loop = self.loop if self.loop is not None else asyncio.get_event_loop()
+        pool = self._pools.get(loop)
+        if pool is None:
+            return None
+        return pool.stats
+
+    async def get_listener(self, loop=None):
+        """Returns the :class:`PubSubListener` shared by all :class:`Cache`
+        objects that use the same event loop, creating it if necessary.
+        The size of the subscribers' queues is configured using the
+        ``PUBSUB_QUEUE_SIZE`` key of ``DWARF_CACHE_BACKEND['redis']``.
+
+        Parameters
+        ----------
+        loop = Optional[asyncio.AbstractEventLoop]
+            The loop used for the listener's Redis connection.
+        """
+
+        if loop is None:
+            loop = self.loop if self.loop is not None else asyncio.get_event_loop()
+
+        listener = self._listeners.get(loop)
+        if listener is not None and not listener.closed:
+            return listener
+
+        lock = self._pool_locks.get(loop)
+        if lock is None:
+            lock = self._pool_locks[loop] = asyncio.Lock(loop=loop)
+
+        async with lock:
+            listener = self._listeners.get(loop)
+            if listener is None or listener.closed:
+                redis = await self.get_async_redis(loop=loop)
+                listener = self._listeners[loop] = PubSubListener(
+                    redis, loop, queue_size=self.config.get('PUBSUB_QUEUE_SIZE', 100))
+        return listener
+
     def get(self, key, default=None):
         """Retrieves a key's value from the cache.
 
@@ -68,6 +573,16 @@ class Cache:
             The value to return if the key wasn't found in the database.
         """
 
+        if self.near_cache is not None:
+            key = self.make_key(key)
+            value, token = self.near_cache.get(key)
+            if value is None:
+                value = self.backend.get_client(key).get(key)
+                if value is None:
+                    return default
+                self.near_cache.set(key, value, token)
+            return self.backend.get_value(value)
+
         if not self.extension:
             return self.backend.get(key=key, default=default)
         else:
@@ -89,7 +604,9 @@ class Cache:
 
         if self.extension:
             key = self.extension + '_' + key
-        return self.backend.set(key=key, value=value, timeout=timeout)
+        result = self.backend.set(key=key, value=value, timeout=timeout)
+        self._invalidate(self.backend.make_key(key))
+        return result
 
     def get_many(self, keys):
         """Retrieves keys from the cache and returns them with their values as a dict.
@@ -101,26 +618,53 @@ class Cache:
         """
 
         if self.extension:
-            keys = [self.extension + '_' + key for key in keys]
+            prefix = self.extension + '_'
+            values = self.backend.get_many(keys=[prefix + key for key in keys])
+            return {key[len(prefix):]: value for key, value in values.items()}
         return self.backend.get_many(keys=keys)
 
     def set_many(self, data, timeout=None):
-        """Sets an iterable of keys in the cache.
-        If a key wasn't found, it inserts None into the list of values instead.
+        """Sets an iterable of keys in the cache using a single
+        Redis transaction and returns whether each key was set as a dict.
 
         Parameters
         ----------
         data : dict
-            A dict consisting of key-value pairs.
-        timeout : Optional[int]
+            A dict consisting of key-value pairs. It is not modified.
+        timeout : Optional[Union[int, dict]]
             After this amount of time (in seconds), all keys in `data` will be deleted.
+            May also be a dict that maps keys in `data` to their own timeouts;
+            keys missing from it will not be deleted.
         """
 
-        if self.extension:
-            for key in data:
-                value = data.pop(key)
-                data[self.extension + '_' + key] = value
-        return self.backend.set_many(data=data, timeout=timeout)
+        results = {}
+        keys = []
+        pipeline = self.backend.get_client(None, write=True).pipeline(transaction=True)
+        for key, value, key_timeout in self._prepare_many(data, timeout, results):
+            keys.append(key)
+            if key_timeout == 0:
+                pipeline.expire(self.make_key(key), 0)
+            else:
+                pipeline.set(self.make_key(key), self.backend.prep_value(value), ex=key_timeout)
+        if keys:
+            for key, result in zip(keys, pipeline.execute()):
+                results[key] = bool(result)
+            self._invalidate(*[self.make_key(key) for key in keys])
+        return results
+
+    @staticmethod
+    def _prepare_many(data, timeout, results):
+        """Yields the keys and values of `data` with their timeouts,
+        marking keys with negative timeouts as not set in `results`."""
+
+        for key, value in data.items():
+            key_timeout = timeout.get(key) if isinstance(timeout, dict) else timeout
+            if key_timeout is not None:
+                key_timeout = int(key_timeout)
+                if key_timeout < 0:
+                    results[key] = False
+                    continue
+            yield key, value, key_timeout
 
     def delete(self, key):
         """Deletes a key from the cache.
@@ -133,7 +677,152 @@ class Cache:
 
         if self.extension:
             key = self.extension + '_' + key
-        return self.backend.delete(key=key)
+        result = self.backend.delete(key=key)
+        self._invalidate(self.backend.make_key(key))
+        return result
+
+    def delete_many(self, keys):
+        """Deletes keys from the cache.
+
+        Parameters
+        ----------
+        keys : iter of str
+            The keys to delete from the cache.
+        """
+
+        keys = [self.make_key(key) for key in keys]
+        if not keys:
+            return
+        self.backend.get_client(None, write=True).delete(*keys)
+        self._invalidate(*keys)
+
+    def make_key(self, key):
+        """Returns the key under which `key` is actually stored in Redis,
+        including the extension prefix and the cache backend's key prefix
+        and version. Both the synchronous and the asynchronous methods
+        store keys this way, so they can read each other's keys.
+
+        Parameters
+        ----------
+        key : str
+            The key as it is passed to :meth:`get` or :meth:`set`.
+        """
+
+        if self.extension:
+            key = self.extension + '_' + key
+        return self.backend.make_key(key)
+
+    async def aget(self, key, default=None):
+        """Retrieves a key's value from the cache without blocking the event loop.
+
+        Parameters
+        ----------
+        key : str
+            The key to retrieve from the cache.
+        default : Optional
+            The value to return if the key wasn't found in the database.
+        """
+
+        key = self.make_key(key)
+        token = None
+        if self.near_cache is not None:
+            value, token = self.near_cache.get(key)
+            if value is not None:
+                return self.backend.get_value(value)
+        pool = await self.get_pool()
+        value = await pool.redis.get(key)
+        if value is None:
+            return default
+        if self.near_cache is not None:
+            self.near_cache.set(key, value, token)
+        return self.backend.get_value(value)
+
+    async def aset(self, key, value, timeout=None):
+        """Sets a key in the cache without blocking the event loop.
+
+        Parameters
+        ----------
+        key : str
+            The key to set in the cache.
+        value
+            The value to assign to the key.
+        timeout : Optional[int]
+            After this amount of time (in seconds), the key will be deleted.
+        """
+
+        key = self.make_key(key)
+        pool = await self.get_pool()
+        if timeout is not None and timeout < 0:
+            return False
+        elif timeout == 0:
+            result = bool(await pool.redis.expire(key, 0))
+        else:
+            result = await pool.redis.set(key, self.backend.prep_value(value), expire=int(timeout or 0))
+        await self._ainvalidate(key)
+        return result
+
+    async def aget_many(self, keys):
+        """Retrieves keys from the cache without blocking the event loop
+        and returns the keys that were found with their values as a dict.
+
+        Parameters
+        ----------
+        keys : iter of str
+            The keys to retrieve from the cache.
+        """
+
+        keys = list(keys)
+        if not keys:
+            return {}
+        pool = await self.get_pool()
+        values = await pool.redis.mget(*[self.make_key(key) for key in keys])
+        return {key: self.backend.get_value(value) for key, value in zip(keys, values) if value is not None}
+
+    async def aset_many(self, data, timeout=None):
+        """Sets an iterable of keys in the cache using a single Redis transaction
+        without blocking the event loop and returns whether each key was set as a dict.
+
+        Parameters
+        ----------
+        data : dict
+            A dict consisting of key-value pairs. It is not modified.
+        timeout : Optional[Union[int, dict]]
+            After this amount of time (in seconds), all keys in `data` will be deleted.
+            May also be a dict that maps keys in `data` to their own timeouts;
+            keys missing from it will not be deleted.
+        """
+
+        results = {}
+        to_set = list(self._prepare_many(data, timeout, results))
+        if not to_set:
+            return results
+        pool = await self.get_pool()
+        async with pool.acquire() as redis:
+            transaction = redis.multi_exec()
+            for key, value, key_timeout in to_set:
+                if key_timeout == 0:
+                    transaction.expire(self.make_key(key), 0)
+                else:
+                    transaction.set(self.make_key(key), self.backend.prep_value(value), expire=key_timeout or 0)
+            for (key, _, _), result in zip(to_set, await transaction.execute()):
+                results[key] = bool(result)
+        await self._ainvalidate(*[self.make_key(key) for key, _, _ in to_set])
+        return results
+
+    async def adelete(self, key):
+        """Deletes a key from the cache without blocking the event loop.
+
+        Parameters
+        ----------
+        key : str
+            The key to delete from the cache.
+        """
+
+        key = self.make_key(key)
+        pool = await self.get_pool()
+        result = bool(await pool.redis.delete(key))
+        await self._ainvalidate(key)
+        return result
 
     async def subscribe(self, channel, limit=None):
         """Subscribes to a Redis Pub/Sub channel.
@@ -142,6 +831,8 @@ class Cache:
         All cogs can implement a coroutine method called
         'on_' + `channel` + '_message' that will be executed when
         a message is sent to the `channel`.
+        All subscriptions of a process share a single connection;
+        cancelling the task that awaits this coroutine unsubscribes.
 
         Parameters
         ----------
@@ -152,31 +843,52 @@ class Cache:
             The maximum number of times messages published to the channel will be read.
         """
 
+        await self._subscribe('channel:' + channel, False, limit)
+
+    async def psubscribe(self, pattern, limit=None):
+        """Subscribes to all Redis Pub/Sub channels matching a pattern.
+        When a message is received on one of the channels, `self.bot` is used to
+        dispatch an event called ``channel + '_message'``, where ``channel`` is the
+        name of the channel the message was published to, passing the message as a parameter.
+
+        Parameters
+        ----------
+        pattern : str
+            A glob-style pattern of the channels to subscribe to.
+            The internal pattern will be `'channel:' + pattern`.
+        limit : Optional[int]
+            The maximum number of times messages published to the channels will be read.
+        """
+
+        await self._subscribe('channel:' + pattern, True, limit)
+
+    async def _subscribe(self, name, pattern, limit):
         if limit is not None:
             if not isinstance(limit, int):
                 raise TypeError("limit must be of type int")
             if not limit > 0:
                 raise ValueError("limit must be greater than 0")
 
-        redis = await self.get_async_redis()
-        channels = await redis.subscribe('channel:' + channel)
-        actual_channel = channels[0]
+        listener = await self.get_listener()
+        queue = await listener.subscribe(name, pattern=pattern)
         try:
-            while await actual_channel.wait_message():
-                message = await actual_channel.get(encoding='utf-8')
-                self.bot.dispatch(channel + '_message', message)
+            while True:
+                message = await queue.get()
+                if message is None:  # the connection was closed
+                    break
+                if pattern:
+                    channel, message = message
+                    self.bot.dispatch(channel[len('channel:'):] + '_message', message)
+                else:
+                    self.bot.dispatch(name[len('channel:'):] + '_message', message)
                 if limit == 1:
                     break
                 elif limit is not None:
                     limit -= 1
-
-            await redis.unsubscribe(actual_channel)
-            redis.close()
-            return
         except asyncio.CancelledError:
-            await redis.unsubscribe(actual_channel)
-            redis.close()
-            return
+            pass
+        finally:
+            await listener.unsubscribe(name, queue, pattern=pattern)
 
     async def publish(self, channel, message=1):
         """Publishes a message to a Redis Pub/Sub channel.
@@ -191,7 +903,6 @@ class Cache:
         """
 
         channel = 'channel:' + channel
-        redis = await self.get_async_redis()
-        await redis.publish(channel, message)
-        redis.close()
-        return
+        pool = await self.get_pool()
+        async with pool.acquire() as redis:
+            await redis.publish(channel, message)
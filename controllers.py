@@ -1,14 +1,26 @@
+import asyncio
+import hashlib
 import subprocess
 import shutil
 import os
 import stat
+import sys
 import importlib
+import json
+import logging
+import threading
 import pip
 
+from django.apps import apps
+from django.conf import settings
 from django.core import management
+from django.core.exceptions import AppRegistryNotReady
+from redis.exceptions import RedisError
 
-from . import __version__
+from . import __version__, DWARF_ROOT
 from .cache import Cache
+from .db import get_executor
+from .repositories import RepositoryCache, RepositoryError
 
 try:
     import dwarf.extensions
@@ -17,6 +29,77 @@ except ImportError:
                       "git clone https://github.com/Dwarf-Community/Dwarf-Extensions dwarf/extensions")
 
 
+log = logging.getLogger('dwarf.controllers')
+
+
+def get_manifest_path():
+    """Returns the path of the extension manifest, a JSON file listing the
+    installed extensions. Set by ``DWARF_EXTENSION_MANIFEST``, defaults to
+    ``extensions.json`` in Dwarf's directory."""
+
+    return getattr(settings, 'DWARF_EXTENSION_MANIFEST', os.path.join(DWARF_ROOT, 'extensions.json'))
+
+
+def read_manifest():
+    """Returns the names of the extensions listed in the extension manifest,
+    or ``None`` if there is no readable manifest."""
+
+    try:
+        with open(get_manifest_path(), encoding='utf-8') as manifest_file:
+            extensions = json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(extensions, list):
+        return None
+    return extensions
+
+
+def write_manifest(extensions):
+    """Replaces the extension manifest atomically.
+
+    Parameters
+    ----------
+    extensions : iter of str
+        The names of the installed extensions.
+    """
+
+    path = get_manifest_path()
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as manifest_file:
+        json.dump(list(extensions), manifest_file)
+    os.replace(temp_path, path)
+
+
+def get_installed_extensions():
+    """Returns the names of the installed extensions without a controller.
+
+    Meant for code that runs while Django is loading, like ``models.py``
+    and ``urls.py``: the extension manifest is read from disk, and the cache
+    is only asked if there is no manifest yet, in which case the manifest is
+    written for the next time. If the cache can't be reached either,
+    no extensions are returned instead of raising an exception.
+    """
+
+    extensions = read_manifest()
+    if extensions is not None:
+        return extensions
+
+    try:
+        extensions = Cache().get('extensions', default=[])
+    except RedisError as error:
+        log.warning("could not read the installed extensions from the cache: %s", error)
+        return []
+    try:
+        write_manifest(extensions)
+    except OSError as error:
+        log.warning("could not write the extension manifest: %s", error)
+    return extensions
+
+
+# makemigrations and migrate must not run concurrently
+_migration_lock = threading.Lock()
+
+
 class InstallationError(Exception):
     pass
 
@@ -33,6 +116,84 @@ class ExtensionNotFound(Exception):
     pass
 
 
+class DependencyCycle(Exception):
+    """Raised when extensions depend on each other in a cycle.
+
+    Attributes
+    ----------
+    cycle : list of str
+        The names of the extensions forming the cycle, in order.
+    """
+
+    def __init__(self, cycle):
+        super().__init__(" -> ".join(cycle + cycle[:1]))
+        self.cycle = cycle
+
+
+class InstallPlan:
+    """The order in which extensions have to be installed.
+
+    Attributes
+    ----------
+    layers : list of list of str
+        The extensions to install, in layers. The extensions of a
+        layer only depend on the extensions of earlier layers or on
+        installed extensions, so they can be installed concurrently.
+    dependencies : dict
+        Maps the name of every extension in the plan to the names
+        of the extensions in the plan it depends on.
+    """
+
+    def __init__(self, layers, dependencies):
+        self.layers = layers
+        self.dependencies = dependencies
+
+    @property
+    def extensions(self):
+        return [extension for layer in self.layers for extension in layer]
+
+    def dependents(self, extension):
+        """Returns the names of the extensions in the plan that
+        depend on an extension, directly or indirectly."""
+
+        dependents = set()
+        pending = [extension]
+        while pending:
+            current = pending.pop()
+            for _extension, dependencies in self.dependencies.items():
+                if current in dependencies and _extension not in dependents:
+                    dependents.add(_extension)
+                    pending.append(_extension)
+        return dependents
+
+
+def _find_cycle(graph):
+    """Returns one cycle in a dependency graph as a list of nodes."""
+
+    visiting = []
+    visited = set()
+
+    def visit(node):
+        if node in visiting:
+            return visiting[visiting.index(node):]
+        if node in visited:
+            return None
+        visiting.append(node)
+        for dependency in graph.get(node, ()):
+            cycle = visit(dependency)
+            if cycle is not None:
+                return cycle
+        visiting.pop()
+        visited.add(node)
+        return None
+
+    for node in graph:
+        cycle = visit(node)
+        if cycle is not None:
+            return cycle
+    return None
+
+
 class BaseController:
     """Internal API that manages extensions and makes data available that
     needs to be loaded before Django loads any models.
@@ -49,11 +210,24 @@ class BaseController:
         The cache backend connection of the controller.
     bot
         The bot used for specific methods.
+    repositories : Optional[:class:`repositories.RepositoryCache`]
+        The local cache extensions are cloned from, or ``None``
+        if ``DWARF_REPOSITORY_CACHE`` is set to ``None``.
     """
 
     def __init__(self, bot=None):
         self.cache = Cache(bot=bot)
         self.bot = bot
+        if getattr(settings, 'DWARF_REPOSITORY_CACHE', '') is None:
+            self.repositories = None
+        else:
+            self.repositories = RepositoryCache()
+
+    @property
+    def loop(self):
+        if self.bot is not None:
+            return self.bot.loop
+        return asyncio.get_event_loop()
 
     def get_token(self):
         """Retrieves the bot's token."""
@@ -107,7 +281,7 @@ class BaseController:
         # libraries and packages the extension requires
         requirements = []
         try:
-            with open('dwarf/{}/requirements.txt') as requirements_file:
+            with open('dwarf/{}/requirements.txt'.format(extension)) as requirements_file:
                 requirements = requirements_file.readlines()
         except FileNotFoundError:
             pass
@@ -204,23 +378,258 @@ class BaseController:
         if extension not in extensions:
             raise ExtensionNotFound(extension)
 
-        dependencies_tree = self.get_dependencies()
-
-        depending = []
-
-        for _extension in list(dependencies_tree.keys()):
-            for dependency in dependencies_tree[_extension]:
-                if dependency is extension:
-                    depending.append(_extension)
-
+        depending = self.get_dependents(extension)
         if depending:
             return depending
 
         self.delete_extension(extension)
         self.sync_database()
         self.unregister_extension(extension)
+        dependencies = self.get_dependencies()
+        if dependencies.pop(extension, None) is not None:
+            self.set_dependencies(dependencies)
         return None
 
+    def plan_installation(self, extensions):
+        """Plans the installation of extensions and the extensions they depend on.
+
+        The dependencies of extensions are looked up in the Dwarf Extension
+        Index; dependencies that are installed already are left out.
+
+        Parameters
+        ----------
+        extensions : iter of str
+            The names of the extensions that should be installed.
+
+        Returns
+        -------
+        :class:`InstallPlan`
+            The extensions that aren't installed yet, in layers.
+
+        Raises
+        ------
+        ExtensionNotInIndex
+            An extension that isn't installed isn't in the index either.
+        DependencyCycle
+            The extensions depend on each other in a cycle.
+        """
+
+        installed = set(self.get_extensions())
+        graph = {}
+        pending = [extension for extension in extensions if extension not in installed]
+        while pending:
+            extension = pending.pop()
+            if extension in graph:
+                continue
+            try:
+                entry = dwarf.extensions.INDEX[extension]
+            except KeyError:
+                raise ExtensionNotInIndex(extension)
+            graph[extension] = [dependency for dependency in entry.get('dependencies', [])
+                                if dependency not in installed]
+            pending.extend(graph[extension])
+
+        layers = []
+        remaining = dict(graph)
+        while remaining:
+            layer = sorted(extension for extension, dependencies in remaining.items()
+                           if not any(dependency in remaining for dependency in dependencies))
+            if not layer:
+                raise DependencyCycle(_find_cycle(remaining))
+            layers.append(layer)
+            for extension in layer:
+                del remaining[extension]
+
+        return InstallPlan(layers, graph)
+
+    def get_dependents(self, extension):
+        """Returns the names of the installed extensions that depend on an extension.
+
+        Parameters
+        ----------
+        extension : str
+            The name of the extension.
+        """
+
+        dependents = self.cache.get('dependents')
+        if dependents is None:
+            # the reverse index predates this installation, build it
+            self.set_dependencies(self.get_dependencies())
+            dependents = self.cache.get('dependents', default={})
+        return list(dependents.get(extension, []))
+
+    @staticmethod
+    async def _report(progress, extension, step):
+        if progress is not None:
+            await progress(extension, step)
+
+    async def _run_process(self, *args):
+        """Runs a process without blocking the event loop and
+        returns its exit code and its (combined) output."""
+
+        process = await asyncio.create_subprocess_exec(*args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                                       loop=self.loop)
+        output, _ = await process.communicate()
+        return process.returncode, output.decode(errors='replace')
+
+    @staticmethod
+    def _check_extension(extension):
+        """Imports a downloaded extension and returns its dependencies
+        and the requirements and dependencies that can't be imported."""
+
+        importlib.invalidate_caches()
+        module_obj = importlib.import_module('dwarf.' + extension)
+        # libraries and packages the extension requires
+        requirements = list(getattr(module_obj, 'requirements', []))
+        try:
+            with open('dwarf/{}/requirements.txt'.format(extension)) as requirements_file:
+                requirements += [line.strip() for line in requirements_file
+                                 if line.strip() and not line.startswith('#')]
+        except FileNotFoundError:
+            pass
+        # other extensions the extension requires
+        dependencies = getattr(module_obj, 'dependencies', [])
+
+        failed_to_import = {
+            'packages': [],
+            'extensions': [],
+        }
+
+        for requirement in requirements:
+            try:
+                importlib.import_module(requirement)
+            except ImportError:
+                failed_to_import['packages'].append(requirement)
+
+        for dependency in dependencies:
+            try:
+                importlib.import_module('dwarf.' + dependency)
+            except ImportError:
+                failed_to_import['extensions'].append(dependency)
+
+        return dependencies, failed_to_import
+
+    async def ainstall_extension(self, extension, repository=None, progress=None):
+        """Like :meth:`install_extension`, but without blocking the event loop:
+        Git runs as a subprocess and migrations run in a worker thread,
+        so several extensions can be installed concurrently.
+
+        Parameters
+        ----------
+        extension : str
+            The name of the extension that should be installed.
+        repository : Optional[str]
+            The Git repository URL of the extension.
+        progress : Optional[coroutine function]
+            Awaited with the name of the extension and a short
+            description of the current step whenever a step starts.
+        """
+
+        extensions = self.get_extensions()
+        if extension in extensions:
+            raise ExtensionAlreadyInstalled(extension)
+
+        await self._report(progress, extension, "downloading")
+        await self.adownload_extension(extension, repository)
+
+        await self._report(progress, extension, "checking requirements")
+        dependencies, failed_to_import = await get_executor().run(self._check_extension, extension, loop=self.loop)
+        if failed_to_import['packages'] or failed_to_import['extensions']:
+            await get_executor().run(self.delete_extension, extension, loop=self.loop)
+            self.unregister_extension(extension)
+            return failed_to_import
+
+        await self._report(progress, extension, "migrating the database")
+        await self.async_database()
+        self.register_extension(extension)
+        self.set_dependencies(dependencies, extension)
+        return None
+
+    async def aupdate_extension(self, extension, progress=None):
+        """Like :meth:`update_extension`, but without blocking the event loop.
+
+        Parameters
+        ----------
+        extension : str
+            The name of the extension that should be updated.
+        progress : Optional[coroutine function]
+            Awaited with the name of the extension and a short
+            description of the current step whenever a step starts.
+        """
+
+        extensions = self.get_extensions()
+        if extension not in extensions:
+            raise ExtensionNotFound(extension)
+
+        await self._report(progress, extension, "downloading the update")
+        await self.adownload_extension_update(extension)
+
+        await self._report(progress, extension, "checking requirements")
+        dependencies, failed_to_import = await get_executor().run(self._check_extension, extension, loop=self.loop)
+        if failed_to_import['packages'] or failed_to_import['extensions']:
+            return failed_to_import
+
+        await self._report(progress, extension, "migrating the database")
+        await self.async_database()
+        self.register_extension(extension)
+        self.set_dependencies(dependencies, extension)
+        return None
+
+    async def adownload_extension(self, extension, repository=None):
+        if repository is None:
+            try:
+                repository = dwarf.extensions.INDEX[extension]['repository']
+            except KeyError:
+                raise ExtensionNotInIndex(extension)
+
+        if self.repositories is not None:
+            try:
+                await self.repositories.acheckout(repository, 'dwarf/' + extension, loop=self.loop)
+            except RepositoryError as error:
+                if os.path.exists('dwarf/' + extension):
+                    await get_executor().run(self.delete_extension, extension, loop=self.loop)
+                raise InstallationError(str(error))
+            return
+
+        exit_code, output = await self._run_process('git', 'clone', '-q', repository, 'dwarf/' + extension)
+        if exit_code > 0:
+            if os.path.exists('dwarf/' + extension):
+                await get_executor().run(self.delete_extension, extension, loop=self.loop)
+            raise InstallationError('could not clone repository "{0}" (git exited with '
+                                    'exit code: {1}): {2}'.format(repository, exit_code, output.strip()))
+
+    async def adownload_extension_update(self, extension):
+        try:
+            repository = dwarf.extensions.INDEX[extension]['repository']
+        except KeyError:
+            raise ExtensionNotInIndex(extension)
+
+        if self.repositories is not None:
+            try:
+                await self.repositories.aupdate(repository, 'dwarf/' + extension, loop=self.loop)
+            except RepositoryError as error:
+                raise InstallationError(str(error))
+            return
+
+        # pulling through RepositoryCache records the update for rollbacks
+        try:
+            await RepositoryCache().apull('dwarf/' + extension, repository, loop=self.loop)
+        except RepositoryError as error:
+            raise InstallationError(str(error))
+
+    async def ainstall_package(self, package):
+        """Installs a package from PyPI without blocking the event loop
+        and returns pip's exit code.
+
+        Parameters
+        ----------
+        package : str
+            The name of the package to install.
+        """
+
+        exit_code, _ = await self._run_process(sys.executable, '-m', 'pip', 'install', '--upgrade', package)
+        return exit_code
+
     def get_dependencies(self, extension=None):
         if extension is None:
             return self.cache.get('dependencies', default={})
@@ -232,6 +641,12 @@ class BaseController:
 
     def set_dependencies(self, dependencies, extension=None):
         if extension is None:
+            # maintain the reverse index used by uninstall checks
+            dependents = {}
+            for _extension, _dependencies in dependencies.items():
+                for dependency in _dependencies:
+                    dependents.setdefault(dependency, []).append(_extension)
+            self.cache.set('dependents', dependents)
             return self.cache.set('dependencies', dependencies)
 
         _dependencies = self.get_dependencies()
@@ -245,20 +660,65 @@ class BaseController:
             except KeyError:
                 raise ExtensionNotInIndex(extension)
 
+        if self.repositories is not None:
+            try:
+                self.repositories.checkout(repository, 'dwarf/' + extension)
+            except RepositoryError as error:
+                if os.path.exists('dwarf/' + extension):
+                    self.delete_extension(extension)
+                raise InstallationError(str(error))
+            return
+
         exit_code = subprocess.run(['git', 'clone', '-q', repository, 'dwarf/' + extension]).returncode
         if exit_code > 0:
             self.delete_extension(extension)
             raise InstallationError('could not clone repository "{0}" (git exited with '
                                     'exit code: {1})'.format(repository, exit_code))
 
-    @staticmethod
-    def download_extension_update(extension):
+    def download_extension_update(self, extension):
         try:
             repository = dwarf.extensions.INDEX[extension]['repository']
         except KeyError:
             raise ExtensionNotInIndex(extension)
 
-        subprocess.run(['git', 'pull', repository, 'dwarf/' + extension])
+        if self.repositories is not None:
+            try:
+                self.repositories.update(repository, 'dwarf/' + extension)
+            except RepositoryError as error:
+                raise InstallationError(str(error))
+            return
+
+        # pulling through RepositoryCache records the update for rollbacks
+        try:
+            RepositoryCache().pull('dwarf/' + extension, repository)
+        except RepositoryError as error:
+            raise InstallationError(str(error))
+
+    async def arollback_extension(self, extension, revision=None):
+        """Resets an installed extension to a commit, by default the one
+        it was at before its last update that wasn't rolled back yet,
+        without using the network, and migrates the database.
+        Returns the commit.
+
+        Parameters
+        ----------
+        extension : str
+            The name of the extension.
+        revision : Optional[str]
+            The commit, branch or tag to reset the extension to.
+        """
+
+        if extension not in self.get_extensions():
+            raise ExtensionNotFound(extension)
+
+        # rolling back works on the working copy alone, so it doesn't need the cache
+        repositories = self.repositories or RepositoryCache()
+        try:
+            revision = await repositories.arollback('dwarf/' + extension, revision, loop=self.loop)
+        except RepositoryError as error:
+            raise InstallationError(str(error))
+        await self.async_database()
+        return revision
 
     @staticmethod
     def delete_extension(extension):
@@ -294,7 +754,8 @@ class BaseController:
         return self.cache.get('extensions', default=[])
 
     def set_extensions(self, extensions):
-        """Sets the list of the installed extensions.
+        """Sets the list of the installed extensions
+        and writes it to the extension manifest.
 
         Parameters
         ----------
@@ -302,12 +763,102 @@ class BaseController:
             The names of the extensions to set as installed.
         """
 
-        return self.cache.set('extensions', extensions)
+        result = self.cache.set('extensions', extensions)
+        write_manifest(extensions)
+        return result
 
     @staticmethod
-    def sync_database():
-        management.call_command('makemigrations', 'dwarf')
-        management.call_command('migrate', 'dwarf')
+    def get_models_fingerprint():
+        """Returns a SHA-256 hex digest of the source of every model module of
+        Dwarf and its extensions. It changes whenever a model module is
+        added, removed or changed.
+
+        The model modules are ``models.py`` or every module of a ``models``
+        package in Dwarf's directory and in every extension's directory,
+        plus the modules that define the models registered in the ``dwarf``
+        app, wherever they are.
+
+        Returns ``None`` if the source of one of them can't be found, or
+        if a model module on disk wasn't imported by this process, as is
+        the case for extensions installed since Django was set up. Their
+        models aren't registered, so migrations made now would miss them."""
+
+        paths = set()
+
+        def add_module(path):
+            if os.path.basename(path) == '__init__.py':
+                for directory, _, names in os.walk(os.path.dirname(path)):
+                    paths.update(os.path.join(directory, name) for name in names if name.endswith('.py'))
+            else:
+                paths.add(path)
+
+        packages = [(DWARF_ROOT, 'dwarf')] + [(os.path.join(DWARF_ROOT, name), 'dwarf.' + name)
+                                              for name in os.listdir(DWARF_ROOT)]
+        for directory, package in packages:
+            for path in (os.path.join(directory, 'models.py'), os.path.join(directory, 'models', '__init__.py')):
+                if not os.path.isfile(path):
+                    continue
+                if package + '.models' not in sys.modules:
+                    return None
+                add_module(path)
+
+        try:
+            app_config = apps.get_app_config('dwarf')
+            module_names = {model.__module__ for model in app_config.get_models(include_auto_created=True)}
+        except (AppRegistryNotReady, LookupError):
+            return None
+        if app_config.models_module is not None:
+            module_names.add(app_config.models_module.__name__)
+        for module_name in module_names:
+            path = getattr(sys.modules.get(module_name), '__file__', None)
+            if path is None or not path.endswith('.py'):
+                return None
+            add_module(os.path.abspath(path))
+
+        fingerprint = hashlib.sha256()
+        for path in sorted(os.path.abspath(path) for path in paths):
+            fingerprint.update(os.path.relpath(path, DWARF_ROOT).encode('utf-8') + b'\0')
+            with open(path, 'rb') as models_file:
+                fingerprint.update(hashlib.sha256(models_file.read()).digest())
+        return fingerprint.hexdigest()
+
+    def sync_database(self, force=False):
+        """Creates and applies migrations for the models of Dwarf and its extensions,
+        unless no model module changed since the database was last synced.
+        If :meth:`get_models_fingerprint` returns ``None``, it always syncs
+        and doesn't record the database as synced, so the next start syncs
+        again once the new models are registered.
+        All extension models belong to the ``dwarf`` app, so it's the only one migrated.
+
+        Parameters
+        ----------
+        force : bool
+            Sync even if no model module changed, for example
+            because the database was replaced. Defaults to ``False``.
+
+        Returns
+        -------
+        bool
+            Whether the migration commands were run.
+        """
+
+        with _migration_lock:
+            fingerprint = self.get_models_fingerprint()
+            if not force and fingerprint is not None and self.cache.get('models_fingerprint') == fingerprint:
+                return False
+            management.call_command('makemigrations', 'dwarf')
+            management.call_command('migrate', 'dwarf')
+            if fingerprint is None:
+                self.cache.delete('models_fingerprint')
+            else:
+                self.cache.set('models_fingerprint', fingerprint)
+            return True
+
+    async def async_database(self, force=False):
+        """Like :meth:`sync_database`, but runs in a worker thread
+        so it doesn't block the event loop."""
+
+        return await get_executor().run(self.sync_database, force, loop=self.loop)
 
     @staticmethod
     def install_package(package):
@@ -9,8 +9,8 @@ from discord.ext import commands
 from dwarf import formatting as f
 from dwarf.bot import Cog
 from dwarf.controllers import BaseController
-from dwarf.errors import (ExtensionAlreadyInstalled, ExtensionNotFound, ExtensionNotInIndex,
-                          PrefixAlreadyExists, PrefixNotFound)
+from dwarf.errors import (DependencyCycle, ExtensionAlreadyInstalled, ExtensionNotFound, ExtensionNotInIndex,
+                          InstallationError, PrefixAlreadyExists, PrefixNotFound)
 from . import strings
 from .controllers import CoreController
 
@@ -63,6 +63,11 @@ class Core(Cog):
         extensions = extensions.lower().split()
 
         installation_status = defaultdict(lambda: [])
+        # installs run concurrently, but only one of them may ask a question at a time
+        prompt_lock = asyncio.Lock(loop=self.bot.loop)
+
+        async def progress(_extension, step):
+            await ctx.send("'**" + _extension + "**': " + step + "...")
 
         def extension_check(message):
             extension_name = message.content
@@ -75,15 +80,21 @@ class Core(Cog):
             repository = None
             if _extension.startswith('https://'):
                 repository = _extension
-                await ctx.send(strings.specify_extension_name)
-                _extension = await self.bot.wait_for('message', check=extension_check, timeout=60)
-                if _extension is None:
-                    await ctx.send(strings.skipping_this_extension)
-                    return False
+                async with prompt_lock:
+                    await ctx.send(strings.specify_extension_name)
+                    try:
+                        _extension = await self.bot.wait_for('message', check=extension_check, timeout=60)
+                    except asyncio.TimeoutError:
+                        await ctx.send(strings.skipping_this_extension)
+                        return False
                 _extension = _extension.content
             await ctx.send("Installing '**" + _extension + "**'...")
             try:
-                unsatisfied = self.base.install_extension(_extension, repository)
+                unsatisfied = await self.base.ainstall_extension(_extension, repository, progress=progress)
+            except InstallationError as error:
+                await ctx.send("Failed to install '**" + _extension + "**': " + str(error))
+                installation_status['failed_extensions'].append(_extension)
+                return False
             except ExtensionAlreadyInstalled:
                 await ctx.send("The extension '**" + _extension + "**' is already installed.")
                 installation_status['failed_extensions'].append(_extension)
@@ -107,12 +118,13 @@ class Core(Cog):
                     await ctx.send(failure_message)
 
                     if unsatisfied['packages']:
-                        await ctx.send("Do you want to install the required packages now? (yes/no)")
-                        _answer = await self.bot.wait_for_answer(ctx)
+                        async with prompt_lock:
+                            await ctx.send("Do you want to install the required packages now? (yes/no)")
+                            _answer = await self.bot.wait_for_answer(ctx)
                         if _answer is True:
-                            for package in unsatisfied['packages']:
-                                return_code = self.base.install_package(package)
-                                if return_code is 0:
+                            for package in list(unsatisfied['packages']):
+                                return_code = await self.base.ainstall_package(package)
+                                if return_code == 0:
                                     unsatisfied['packages'].remove(package)
                                     await ctx.send("Installed package '**"
                                                    + package + "**' successfully.")
@@ -130,13 +142,16 @@ class Core(Cog):
                             return False
 
                     if not unsatisfied['packages'] and unsatisfied['extensions']:
-                        await ctx.send("Do you want to install the extensions '**"
-                                       + _extension + "**' depends on now? (yes/no)")
-                        _answer = await self.bot.wait_for_answer(ctx)
+                        async with prompt_lock:
+                            await ctx.send("Do you want to install the extensions '**"
+                                           + _extension + "**' depends on now? (yes/no)")
+                            _answer = await self.bot.wait_for_answer(ctx)
                         if _answer is True:
-                            for extension_to_install in unsatisfied['extensions']:
-                                extension_install_return_code = await _install(extension_to_install)
-                                if extension_install_return_code is True:
+                            to_install = list(unsatisfied['extensions'])
+                            return_codes = await asyncio.gather(*(_install(extension_to_install)
+                                                                  for extension_to_install in to_install))
+                            for extension_to_install, return_code in zip(to_install, return_codes):
+                                if return_code is True:
                                     unsatisfied['extensions'].remove(extension_to_install)
 
                             if unsatisfied['extensions']:
@@ -156,8 +171,39 @@ class Core(Cog):
                     installation_status['installed_extensions'].append(_extension)
                     return True
 
-        for extension in extensions:
-            await _install(extension)
+        # extensions from the index are installed in dependency order, every layer concurrently
+        names = [extension for extension in extensions if not extension.startswith('https://')]
+        try:
+            plan = self.base.plan_installation(names)
+        except ExtensionNotInIndex as error:
+            await ctx.send("There is no extension called '**" + str(error) + "**'.")
+            return
+        except DependencyCycle as error:
+            await ctx.send("These extensions depend on each other in a cycle: **" + str(error) + "**")
+            return
+
+        dependencies_to_install = [extension for extension in plan.extensions if extension not in names]
+        if dependencies_to_install:
+            await ctx.send("The following dependencies will be installed too:\n**"
+                           + "**\n**".join(dependencies_to_install) + "**\nProceed? (yes/no)")
+            answer = await self.bot.wait_for_answer(ctx)
+            if answer is not True:
+                await ctx.send("Alright, I will not install any extensions just now.")
+                return
+
+        skipped = set()
+        for layer in plan.layers:
+            await asyncio.gather(*(_install(extension) for extension in layer if extension not in skipped))
+            for extension in layer:
+                if extension in installation_status['failed_extensions']:
+                    skipped.update(plan.dependents(extension))
+        if skipped:
+            await ctx.send("Skipped extensions whose dependencies failed to install:\n**"
+                           + "**\n**".join(sorted(skipped)) + "**")
+            installation_status['failed_extensions'] += sorted(skipped)
+
+        # extensions that are installed already and ones from repositories
+        await asyncio.gather(*(_install(extension) for extension in extensions if extension not in plan.extensions))
 
         completed_message = "Installation completed.\n"
         if installation_status['installed_extensions']:
@@ -175,12 +221,10 @@ class Core(Cog):
         await ctx.send(completed_message)
 
         if installation_status['installed_extensions']:
-            await ctx.send("Reboot Dwarf for changes to take effect.\n"
-                           "Would you like to restart now? (yes/no)")
+            await ctx.send("Would you like to load the installed extensions now? (yes/no)")
             answer = await self.bot.wait_for_answer(ctx)
             if answer is True:
-                await ctx.send("Okay, I'll be right back!")
-                await self.core.restart(restarted_from=ctx.message.channel)
+                await self._reload(ctx, installation_status['installed_extensions'])
 
     @commands.command()
     @commands.is_owner()
@@ -191,11 +235,20 @@ class Core(Cog):
         extensions = extensions.lower().split()
 
         update_status = defaultdict(lambda: [])
+        # updates run concurrently, but only one of them may ask a question at a time
+        prompt_lock = asyncio.Lock(loop=self.bot.loop)
+
+        async def progress(_extension, step):
+            await ctx.send("'**" + _extension + "**': " + step + "...")
 
         async def _update(_extension):
             await ctx.send("Updating '**" + _extension + "**'...")
             try:
-                unsatisfied = self.base.update_extension(_extension)
+                unsatisfied = await self.base.aupdate_extension(_extension, progress=progress)
+            except (InstallationError, ExtensionNotInIndex) as error:
+                await ctx.send("Failed to update '**" + _extension + "**': " + str(error))
+                update_status['failed_extensions'].append(_extension)
+                return False
             except ExtensionNotFound:
                 await ctx.send("The extension '**" + _extension + "**' could not be found.")
                 update_status['failed_extensions'].append(_extension)
@@ -215,13 +268,14 @@ class Core(Cog):
                     await ctx.send(failure_message)
 
                     if unsatisfied['packages']:
-                        await ctx.send("Do you want to install the new requirements of "
-                                       + _extension + " now? (yes/no)")
-                        _answer = await self.bot.wait_for_answer(ctx)
+                        async with prompt_lock:
+                            await ctx.send("Do you want to install the new requirements of "
+                                           + _extension + " now? (yes/no)")
+                            _answer = await self.bot.wait_for_answer(ctx)
                         if _answer is True:
-                            for package in unsatisfied['packages']:
-                                return_code = self.base.install_package(package)
-                                if return_code is 0:
+                            for package in list(unsatisfied['packages']):
+                                return_code = await self.base.ainstall_package(package)
+                                if return_code == 0:
                                     unsatisfied['packages'].remove(package)
                                     await ctx.send("Installed package '**"
                                                    + package + "**' successfully.")
@@ -239,15 +293,17 @@ class Core(Cog):
                             return False
 
                     if not unsatisfied['packages'] and unsatisfied['extensions']:
-                        await ctx.send("Do you want to install the new dependencies of '**"
-                                       + _extension + "**' now? (yes/no)")
-                        _answer = await self.bot.wait_for_response(ctx)
+                        async with prompt_lock:
+                            await ctx.send("Do you want to install the new dependencies of '**"
+                                           + _extension + "**' now? (yes/no)")
+                            _answer = await self.bot.wait_for_answer(ctx)
                         if _answer is True:
-                            await ctx.invoke(self.bot.get_command('install'), ' '.join(unsatisfied['extensions']))
-                        exts = self.base.get_extensions()
-                        for extension_to_check in unsatisfied['extensions']:
-                            if extension_to_check in exts:
-                                unsatisfied['extensions'].remove(extension_to_check)
+                            await ctx.invoke(self.bot.get_command('install'),
+                                             extensions=' '.join(unsatisfied['extensions']))
+                            exts = self.base.get_extensions()
+                            for extension_to_check in list(unsatisfied['extensions']):
+                                if extension_to_check in exts:
+                                    unsatisfied['extensions'].remove(extension_to_check)
 
                             if unsatisfied['extensions']:
                                 await ctx.send("Failed to install one or more of '**"
@@ -266,8 +322,7 @@ class Core(Cog):
                     update_status['updated_extensions'].append(_extension)
                     return True
 
-        for extension in extensions:
-            await _update(extension)
+        await asyncio.gather(*(_update(extension) for extension in extensions))
 
         completed_message = "Update completed.\n"
         if update_status['updated_extensions']:
@@ -285,12 +340,56 @@ class Core(Cog):
         await ctx.send(completed_message)
 
         if update_status['updated_extensions']:
-            await ctx.send("Reboot Dwarf for changes to take effect.\n"
-                           "Would you like to restart now? (yes/no)")
-            answer = await self.bot.wait_for_response(ctx)
+            await ctx.send("Would you like to reload the updated extensions now? (yes/no)")
+            answer = await self.bot.wait_for_answer(ctx)
             if answer is True:
-                await ctx.send("Okay, I'll be right back!")
-                await self.core.restart(restarted_from=ctx.message.channel)
+                await self._reload(ctx, update_status['updated_extensions'])
+
+    async def _reload(self, ctx, extensions):
+        reloaded = []
+        for extension in extensions:
+            try:
+                await self.bot.areload_extension(extension)
+            except Exception as error:
+                await ctx.send("Failed to load '**" + extension + "**': "
+                               + f.inline_code(type(error).__name__ + ': ' + str(error)))
+            else:
+                reloaded.append(extension)
+        if reloaded:
+            await ctx.send("Loaded '**" + "**', '**".join(reloaded) + "**'.\n"
+                           "Changes to models take effect after a restart.")
+
+    @commands.command()
+    @commands.is_owner()
+    async def reload(self, ctx, *, extensions: str):
+        """Reloads extensions without restarting Dwarf."""
+        # [p]reload <extensions>
+
+        extensions = extensions.lower().split()
+        installed = self.base.get_extensions()
+        not_found = [extension for extension in extensions if extension not in installed]
+        if not_found:
+            await ctx.send("The extensions '**" + "**', '**".join(not_found) + "**' could not be found.")
+            return
+        await self._reload(ctx, extensions)
+
+    @commands.command()
+    @commands.is_owner()
+    async def rollback(self, ctx, extension: str, revision: str = None):
+        """Rolls an extension back to the version it had before its last update.
+        Rolling back again undoes the update before that."""
+        # [p]rollback <extension> [revision]
+
+        extension = extension.lower()
+        try:
+            revision = await self.base.arollback_extension(extension, revision)
+        except ExtensionNotFound:
+            await ctx.send("The extension '**" + extension + "**' could not be found.")
+        except InstallationError as error:
+            await ctx.send("Failed to roll back '**" + extension + "**': " + str(error))
+        else:
+            await ctx.send("Rolled '**" + extension + "**' back to " + f.inline_code(revision[:10]) + ".")
+            await self._reload(ctx, [extension])
 
     @commands.command()
     @commands.is_owner()
@@ -352,13 +451,8 @@ class Core(Cog):
             completed_message += "**" + "**\n**".join(uninstall_status['failed_extensions']) + "**\n"
         await ctx.send(completed_message)
 
-        if uninstall_status['uninstalled_extensions']:
-            await ctx.send("Reboot Dwarf for changes to take effect.\n"
-                           "Would you like to restart now? (yes/no)")
-            answer = await self.bot.wait_for_answer(ctx)
-            if answer is True:
-                await ctx.send("Okay, I'll be right back!")
-                await self.core.restart(restarted_from=ctx.message.channel)
+        for extension in uninstall_status['uninstalled_extensions']:
+            await self.bot.aunload_extension(extension)
 
     @commands.command()
     @commands.is_owner()
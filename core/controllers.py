@@ -4,6 +4,8 @@ import discord
 import aiohttp
 
 from dwarf.cache import Cache
+from dwarf.db import get_executor
+from dwarf.registry import get_registry
 from dwarf.models import User, Guild, Channel, Role, Member, Message
 
 
@@ -22,6 +24,10 @@ class CoreController:
     that are connected to the database backend.
     Also provides some basic management and settings functions.
 
+    Guilds, channels, roles and members are looked up through the
+    process-wide :class:`EntityRegistry`, so looking up the same
+    object again doesn't query the database.
+
     Parameters
     ----------
     bot
@@ -31,12 +37,15 @@ class CoreController:
     ----------
     cache : :class:`Cache`
         The cache backend connection of the controller.
+    db : :class:`DatabaseExecutor`
+        The thread pool the controller's asynchronous methods run ORM queries on.
     bot : :class:`Bot`
         The bot that will be restarted, shut down etc.
     """
 
     def __init__(self, bot=None):
         self.cache = Cache(bot=bot)
+        self.db = get_executor()
         self.bot = bot
         if hasattr(bot, 'loop'):
             self.loop = bot.loop
@@ -238,9 +247,21 @@ class CoreController:
         """
 
         if isinstance(guild, discord.Guild):
-            return Guild.objects.get_or_create(id=guild.id)[0]
+            return get_registry().get_guild(guild.id)
         return Guild.objects.get(id=guild)
 
+    async def aget_guild(self, guild):
+        """Retrieves a Dwarf `Guild` object from the database
+        without blocking the event loop.
+
+        Parameters
+        ----------
+        guild
+            Can be a `discord.Guild` object or a guild ID.
+        """
+
+        return await self.db.run(self.get_guild, guild, loop=self.loop)
+
     @staticmethod
     def new_guild(guild):
         """Creates a new Dwarf ˋGuildˋ object and connects it to the database.
@@ -266,10 +287,21 @@ class CoreController:
         """
 
         if isinstance(channel, discord.TextChannel):
-            return Channel.objects.get_or_create(id=channel.id,
-                                                 guild=Guild.objects.get_or_create(id=channel.guild.id)[0])[0]
+            return get_registry().get_channel(channel.id, channel.guild.id)
         return Channel.objects.get(id=channel)
 
+    async def aget_channel(self, channel):
+        """Retrieves a Dwarf `Channel` object from the database
+        without blocking the event loop.
+
+        Parameters
+        ----------
+        channel
+            Can be a `discord.TextChannel` object or a channel ID.
+        """
+
+        return await self.db.run(self.get_channel, channel, loop=self.loop)
+
     @staticmethod
     def new_channel(channel, guild=None):
         """Creates a new Dwarf ˋChannelˋ object and connects it to the database.
@@ -301,9 +333,21 @@ class CoreController:
         """
 
         if isinstance(role, discord.Role):
-            return Role.objects.get_or_create(id=role.id, guild=role.guild.id)[0]
+            return get_registry().get_role(role.id, role.guild.id)
         return Role.objects.get(id=role)
 
+    async def aget_role(self, role):
+        """Retrieves a Dwarf `Role` object from the database
+        without blocking the event loop.
+
+        Parameters
+        ----------
+        role
+            Can be a `discord.Role` object or a role ID.
+        """
+
+        return await self.db.run(self.get_role, role, loop=self.loop)
+
     @staticmethod
     def new_role(role, guild=None):
         """Creates a new Dwarf ˋRoleˋ object and connects it to the database.
@@ -340,7 +384,7 @@ class CoreController:
         """
 
         if isinstance(member, discord.Member):
-            return Member.objects.get_or_create(user=member.id, guild=member.guild.id)[0]
+            return get_registry().get_member(member.id, member.guild.id)
 
         if user is None or guild is None:
             raise ValueError("Either a Member object or both user ID "
@@ -356,6 +400,23 @@ class CoreController:
 
         return Member.objects.get(user=user_id, guild=guild_id)
 
+    async def aget_member(self, member=None, user=None, guild=None):
+        """Retrieves a Dwarf `Member` object from the database
+        without blocking the event loop.
+        Either `member` or both `user` and `guild` must be given as arguments.
+
+        Parameters
+        ----------
+        member : Optional
+            Has to be a `discord.Member` object.
+        user : Optional
+            Can be a `discord.User` object or a user ID.
+        guild : Optional
+            Can be a `discord.Guild` object or a guild ID.
+        """
+
+        return await self.db.run(self.get_member, member=member, user=user, guild=guild, loop=self.loop)
+
     @staticmethod
     def new_member(member=None, user=None, guild=None):
         """Creates a new Dwarf ˋMemberˋ object and connects it to the database.
@@ -399,12 +460,33 @@ class CoreController:
             Can be a `discord.Message` object or a message ID."""
 
         if isinstance(message, discord.Message):
-            return Message.objects.get_or_create(id=message.id, user=message.author.id,
-                                                 channel=message.channel.id, content=message.content,
-                                                 clean_content=message.clean_content)[0]
+            if message.guild is None:
+                raise ValueError("only messages sent in guilds can be stored")
+            # the message references the author and the channel
+            registry = get_registry()
+            registry.get_user(message.author.id)
+            registry.get_channel(message.channel.id, message.guild.id)
+            return Message.objects.get_or_create(id=message.id, defaults={
+                'user_id': message.author.id,
+                'channel_id': message.channel.id,
+                'content': message.content,
+                'clean_content': message.clean_content,
+            })[0]
         else:
             return Message.objects.get(id=message)
 
+    async def aget_message(self, message):
+        """Retrieves a Dwarf `Message` object from the database
+        without blocking the event loop.
+
+        Parameters
+        ----------
+        message
+            Can be a `discord.Message` object or a message ID.
+        """
+
+        return await self.db.run(self.get_message, message, loop=self.loop)
+
     @staticmethod
     def new_message(message):
         """Creates a new Dwarf ˋMessageˋ object and connects it to the database.
@@ -0,0 +1,143 @@
+"""Running database queries without blocking the event loop."""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+
+class DatabaseExecutor:
+    """Runs synchronous ORM code on a bounded pool of worker threads,
+    so slow queries don't block the event loop.
+
+    Every worker thread keeps its own database connections between jobs.
+    Connections that are broken or older than `conn_max_age` are closed
+    before a job runs, just like Django does between requests. Django's
+    own ``CONN_MAX_AGE`` is ignored, because its default of 0 would close
+    the connections after every job.
+
+    Parameters
+    ----------
+    max_workers : Optional[int]
+        The number of worker threads. Defaults to the ``DWARF_DB_WORKERS``
+        setting, or 4 if it isn't set.
+    conn_max_age : Optional[float]
+        How long (in seconds) a worker thread keeps a connection before it
+        reconnects. Defaults to the ``DWARF_DB_CONN_MAX_AGE`` setting, or
+        ``None`` if it isn't set, which keeps connections until they break.
+
+    Attributes
+    ----------
+    jobs : int
+        How many jobs have been completed.
+    queue_wait_time : float
+        The total time (in seconds) jobs waited for a free worker thread.
+    execution_time : float
+        The total time (in seconds) worker threads spent running jobs.
+    max_queue_wait_time : float
+        The longest time (in seconds) a job waited for a free worker thread.
+    max_execution_time : float
+        The longest time (in seconds) a single job ran.
+    """
+
+    def __init__(self, max_workers=None, conn_max_age=None):
+        if max_workers is None:
+            max_workers = getattr(settings, 'DWARF_DB_WORKERS', 4)
+        if conn_max_age is None:
+            conn_max_age = getattr(settings, 'DWARF_DB_CONN_MAX_AGE', None)
+        self.max_workers = max_workers
+        self.conn_max_age = conn_max_age
+        self.jobs = 0
+        self.pending = 0
+        self.queue_wait_time = 0.0
+        self.execution_time = 0.0
+        self.max_queue_wait_time = 0.0
+        self.max_execution_time = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+
+    async def run(self, func, *args, loop=None, **kwargs):
+        """Runs ``func(*args, **kwargs)`` on a worker thread and returns its result.
+
+        Parameters
+        ----------
+        func : Callable
+            The function that runs the ORM code.
+        loop : Optional[asyncio.AbstractEventLoop]
+            The loop that awaits the result.
+        """
+
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        submitted = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            try:
+                self._close_old_connections()
+                return func(*args, **kwargs)
+            finally:
+                self._record(started - submitted, time.perf_counter() - started)
+
+        self.pending += 1
+        try:
+            return await loop.run_in_executor(self._executor, job)
+        finally:
+            self.pending -= 1
+
+    def _close_old_connections(self):
+        now = time.monotonic()
+        for conn in connections.all():
+            if conn.connection is None:
+                continue
+            if getattr(conn, '_dwarf_connection', None) is not conn.connection:
+                conn._dwarf_connection = conn.connection
+                conn._dwarf_opened = now
+            # Django would close the connection once the deadline it derived
+            # from CONN_MAX_AGE passed, so the age is checked here instead
+            conn.close_at = None
+            if self.conn_max_age is not None and now - conn._dwarf_opened >= self.conn_max_age:
+                conn.close()
+        close_old_connections()
+
+    def _record(self, queue_wait_time, execution_time):
+        with self._lock:
+            self.jobs += 1
+            self.queue_wait_time += queue_wait_time
+            self.execution_time += execution_time
+            self.max_queue_wait_time = max(self.max_queue_wait_time, queue_wait_time)
+            self.max_execution_time = max(self.max_execution_time, execution_time)
+
+    @property
+    def stats(self):
+        """Returns a dict describing the executor's queue-wait and execution times."""
+
+        return {
+            'max_workers': self.max_workers,
+            'pending': self.pending,
+            'jobs': self.jobs,
+            'average_queue_wait_time': self.queue_wait_time / self.jobs if self.jobs else 0.0,
+            'max_queue_wait_time': self.max_queue_wait_time,
+            'average_execution_time': self.execution_time / self.jobs if self.jobs else 0.0,
+            'max_execution_time': self.max_execution_time,
+        }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Returns the :class:`DatabaseExecutor` shared by the whole process."""
+
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = DatabaseExecutor()
+    return _executor
@@ -1,3 +1,5 @@
 from .bot import CommandConflict
-from .controllers import ExtensionAlreadyInstalled, ExtensionNotFound, ExtensionNotInIndex
+from .controllers import (DependencyCycle, ExtensionAlreadyInstalled, ExtensionNotFound, ExtensionNotInIndex,
+                          InstallationError)
 from .core.controllers import PrefixAlreadyExists, PrefixNotFound
+from .profiling import StartupBudgetExceeded
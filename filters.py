@@ -0,0 +1,18 @@
+"""REST API filters"""
+
+from rest_framework.filters import BaseFilterBackend
+
+from .permissions import memberships
+
+
+class GuildMembershipFilter(BaseFilterBackend):
+    """Restricts querysets to rows belonging to the guilds the requesting
+    user is a member of, in SQL, for users who are neither staff nor superusers.
+    The viewset's ``membership_field`` names the field holding the guild ID.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        field = getattr(view, 'membership_field', None)
+        if field is None or request.user.is_superuser or request.user.is_staff:
+            return queryset
+        return queryset.filter(**{field + '__in': memberships.get_guild_ids(request)})
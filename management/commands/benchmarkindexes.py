@@ -0,0 +1,74 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from dwarf.models import Member, Message
+
+
+class Command(BaseCommand):
+    help = (
+        "Times member lookups and channel history queries with and without the "
+        "indexes on (user, guild) and (channel, id). The indexes are dropped "
+        "inside a transaction that is rolled back, so nothing is changed, "
+        "but the tables are locked meanwhile. Don't run this while the bot is running."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=500,
+                            help="How many members and channels to query.")
+        parser.add_argument('--history', type=int, default=50,
+                            help="How many messages to read per channel.")
+
+    def handle(self, *args, **options):
+        if not connection.features.can_rollback_ddl:
+            raise CommandError("The database can't roll back schema changes, so the indexes can't be dropped safely.")
+
+        members = list(Member.objects.order_by('?').values_list('user_id', 'guild_id')[:options['samples']])
+        channels = list(Message.objects.order_by().values_list('channel_id', flat=True)
+                        .distinct()[:options['samples']])
+        if not members and not channels:
+            raise CommandError("There are no members or messages to query.")
+
+        def lookup_members():
+            for user_id, guild_id in members:
+                list(Member.objects.filter(user_id=user_id, guild_id=guild_id).values_list('id', flat=True))
+
+        def read_history():
+            for channel_id in channels:
+                list(Message.objects.filter(channel_id=channel_id).order_by('-id')
+                     .values_list('id', flat=True)[:options['history']])
+
+        benchmarks = [("member lookup", lookup_members, len(members)),
+                      ("channel history", read_history, len(channels))]
+        with transaction.atomic():
+            indexed = [self._time(function, count) for _, function, count in benchmarks]
+            with connection.schema_editor() as schema_editor:
+                for constraint in Member._meta.constraints:
+                    schema_editor.remove_constraint(Member, constraint)
+                for index in Message._meta.indexes:
+                    schema_editor.remove_index(Message, index)
+            unindexed = [self._time(function, count) for _, function, count in benchmarks]
+            transaction.set_rollback(True)
+
+        for (name, _, count), with_index, without_index in zip(benchmarks, indexed, unindexed):
+            if not count:
+                continue
+            self.stdout.write("{} ({} queries): {:.3f} ms without the index, {:.3f} ms with it, {:.1f}x faster".format(
+                name, count, without_index * 1000, with_index * 1000, without_index / with_index))
+
+    @staticmethod
+    def _time(function, count, repeat=5):
+        """Returns the median time (in seconds) a single query took."""
+
+        if not count:
+            return 0.0
+        # warm up the caches, so only the plans are compared
+        function()
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - start) / count)
+        return statistics.median(timings)
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import NotSupportedError
+
+from dwarf import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Converts the message table into a table partitioned by month, "
+        "creates upcoming partitions and drops expired ones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true',
+                            help="Convert the message table into a partitioned table first. "
+                                 "Don't run this while the bot is running.")
+        parser.add_argument('--retention-days', type=int, default=None,
+                            help="Drop partitions older than this many days instead of using "
+                                 "the DWARF_MESSAGE_RETENTION_DAYS setting.")
+
+    def handle(self, *args, **options):
+        try:
+            if options['convert']:
+                partitions.convert()
+                self.stdout.write("Converted the message table.")
+            elif not partitions.is_partitioned():
+                raise CommandError("The message table isn't partitioned, run this command with --convert first.")
+            partitions.ensure_partitions()
+            dropped = partitions.drop_expired_partitions(options['retention_days'])
+        except NotSupportedError as error:
+            raise CommandError(str(error))
+
+        for name in dropped:
+            self.stdout.write("Dropped " + name)
+        for month, name in partitions.get_partitions().items():
+            self.stdout.write("{}: {}".format(month.strftime('%Y-%m'), name))
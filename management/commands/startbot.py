@@ -2,7 +2,10 @@ import asyncio
 import importlib
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+
+from dwarf.cache import Cache
+from dwarf.profiling import profiler
 
 
 class Command(BaseCommand):
@@ -10,7 +13,13 @@ class Command(BaseCommand):
         "Creates a bot instance and connects to Discord."
     )
 
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', action='store_true',
+                            help="Write a report of how long starting the bot took and how much memory it used.")
+
     def handle(self, *args, **options):
+        if options['profile']:
+            profiler.enable()
         loop = asyncio.get_event_loop()
         if settings.DEBUG:
             loop.set_debug(True)
@@ -22,3 +31,6 @@ class Command(BaseCommand):
                 break
             else:
                 bot.clear()
+        loop.run_until_complete(Cache.close_pool(loop))
+        if bot.startup_error is not None:
+            raise CommandError(str(bot.startup_error))
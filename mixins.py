@@ -0,0 +1,310 @@
+"""Mixins for the REST API viewsets"""
+
+import hashlib
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import UniqueConstraint
+from django.http import StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from .cache import Cache
+from .models import Member
+from .permissions import memberships
+from .serializers import get_requested_fields
+from .versions import model_versions
+
+
+class ConditionalCacheMixin:
+    """Adds ETag and Last-Modified headers to `list` and `retrieve`
+    responses and answers conditional requests with 304 Not Modified.
+    Both are derived from the model versions kept by :class:`ModelVersions`,
+    so no database query is needed to tell whether a response changed.
+
+    If the ``DWARF_API_RESPONSE_CACHE`` setting is ``True``, response bodies
+    are also cached for ``DWARF_API_RESPONSE_CACHE_TIMEOUT`` seconds
+    (defaults to 60), keyed by their ETag, and served without querying the database.
+
+    ETags depend on the requesting user, their superuser and staff flags and
+    the version of the `Member` model too, because those determine which
+    objects a user may see. Cached responses are served without checking
+    object permissions again, so the ETag changes whenever any of them does.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('stream') == 'ndjson':
+            return super().list(request, *args, **kwargs)
+        return self._conditional(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional(request, super().retrieve, *args, **kwargs)
+
+    def _conditional(self, request, action, *args, **kwargs):
+        versions = model_versions.get(self.queryset.model, Member)
+        last_modified = max(timestamp for _, timestamp in versions.values())
+        digest = hashlib.sha1('\n'.join([
+            versions[self.queryset.model][0],
+            versions[Member][0],
+            str(request.user.pk),
+            # the permissions depend on these flags, so a demoted user
+            # misses the responses cached while they were staff
+            str(request.user.is_superuser),
+            str(request.user.is_staff),
+            request.accepted_renderer.format or '',
+            request.get_full_path(),
+        ]).encode('utf-8')).hexdigest()
+        etag = '"' + digest + '"'
+
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        if ((if_none_match is not None and (etag in if_none_match or if_none_match.strip() == '*'))
+                or (if_none_match is None and if_modified_since is not None
+                    and int(last_modified) <= if_modified_since)):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = None
+            cache = Cache(extension='api') if getattr(settings, 'DWARF_API_RESPONSE_CACHE', False) else None
+            if cache is not None:
+                data = cache.get(digest)
+                if data is not None:
+                    response = Response(data)
+            if response is None:
+                response = action(request, *args, **kwargs)
+                if cache is not None and response.status_code == status.HTTP_200_OK:
+                    cache.set(digest, response.data,
+                              timeout=getattr(settings, 'DWARF_API_RESPONSE_CACHE_TIMEOUT', 60))
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class BulkWriteMixin:
+    """Adds a ``bulk/`` route that writes many objects in one request and
+    one transaction, using ``bulk_create`` and ``bulk_update``.
+
+    * ``POST`` takes a list of objects and creates them.
+    * ``PATCH`` takes a list of partial objects, each including its
+      primary key, and updates them.
+    * ``DELETE`` takes a list of primary keys and deletes the objects.
+
+    Every object is validated by the viewset's serializer, and objects that
+    would share a unique value are rejected. If any of them is invalid or
+    conflicts with a row in the database, nothing is written and the response
+    holds one dict of errors per object, in the order they were sent (empty
+    for valid objects). Otherwise the response holds one result per object,
+    in the same order.
+
+    At most :attr:`bulk_max_items` objects are accepted per request,
+    set by ``DWARF_API_BULK_MAX_ITEMS`` (defaults to 1000).
+    """
+
+    bulk_max_items = getattr(settings, 'DWARF_API_BULK_MAX_ITEMS', 1000)
+
+    @action(detail=False, methods=['post', 'patch', 'delete'], url_path='bulk')
+    def bulk(self, request, *args, **kwargs):
+        items = request.data
+        if not isinstance(items, list):
+            return Response({'detail': "Expected a list of items."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.bulk_max_items:
+            return Response({'detail': "At most {} items may be sent at once.".format(self.bulk_max_items)},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        if request.method == 'POST':
+            return self._bulk_create(items)
+        elif request.method == 'PATCH':
+            return self._bulk_update(items)
+        return self._bulk_destroy(items)
+
+    def _bulk_written(self, model, objects):
+        # bulk queries don't send signals
+        model_versions.bump(model)
+        if model is Member:
+            memberships.invalidate(member.user_id for member in objects)
+
+    @staticmethod
+    def _unique_fields(model):
+        """Returns the attribute names of every set of fields that has to be unique."""
+
+        opts = model._meta
+        field_sets = [[field.name] for field in opts.concrete_fields if field.unique]
+        field_sets += [list(fields) for fields in opts.unique_together]
+        field_sets += [list(constraint.fields) for constraint in getattr(opts, 'constraints', ())
+                       if isinstance(constraint, UniqueConstraint) and constraint.condition is None]
+        return [[opts.get_field(name).attname for name in fields] for fields in field_sets]
+
+    def _check_unique(self, model, objects, errors):
+        """Adds an error to every object that shares a unique value with an earlier one."""
+
+        for attnames in self._unique_fields(model):
+            seen = set()
+            for index, obj in enumerate(objects):
+                if obj is None:
+                    continue
+                values = tuple(getattr(obj, attname) for attname in attnames)
+                if None in values:
+                    continue
+                if values in seen:
+                    errors[index].setdefault(api_settings.NON_FIELD_ERRORS_KEY, []).append(
+                        "Duplicate item in this request: {}.".format(", ".join(attnames)))
+                seen.add(values)
+
+    @staticmethod
+    def _save(write, objects):
+        """Runs a bulk write in a transaction. Returns ``None`` if it succeeded,
+        or one dict of errors per object if it violated a database constraint."""
+
+        try:
+            with transaction.atomic():
+                write(objects)
+            return None
+        except IntegrityError:
+            pass
+
+        # write the objects one by one, each in a savepoint,
+        # to find the conflicting ones, then roll everything back
+        errors = []
+        with transaction.atomic():
+            for obj in objects:
+                try:
+                    with transaction.atomic():
+                        write([obj])
+                    errors.append({})
+                except IntegrityError:
+                    errors.append({api_settings.NON_FIELD_ERRORS_KEY: ["Conflicts with an existing object."]})
+            transaction.set_rollback(True)
+        return errors
+
+    @staticmethod
+    def _coerce_pks(model, pks):
+        """Converts primary keys sent as strings to the type of the primary key field.
+        Primary keys that can't be converted are replaced with ``None``."""
+
+        field = model._meta.pk
+        coerced = []
+        for pk in pks:
+            try:
+                coerced.append(None if pk is None else field.to_python(pk))
+            except ValidationError:
+                coerced.append(None)
+        return coerced
+
+    def _bulk_create(self, items):
+        model = self.queryset.model
+        serializers = [self.get_serializer(data=item) for item in items]
+        errors = [{} if serializer.is_valid() else serializer.errors for serializer in serializers]
+        objects = [model(**serializer.validated_data) if not error else None
+                   for serializer, error in zip(serializers, errors)]
+        self._check_unique(model, objects, errors)
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        errors = self._save(model.objects.bulk_create, objects)
+        if errors is not None:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        self._bulk_written(model, objects)
+        return Response(self.get_serializer(objects, many=True).data, status=status.HTTP_201_CREATED)
+
+    def _bulk_update(self, items):
+        model = self.queryset.model
+        pk_name = model._meta.pk.name
+        pks = [item.get(pk_name) if isinstance(item, dict) else None for item in items]
+        pks = self._coerce_pks(model, [pk if isinstance(pk, (int, str)) else None for pk in pks])
+        instances = self.filter_queryset(self.get_queryset()).in_bulk([pk for pk in pks if pk is not None])
+
+        errors = []
+        objects = []
+        fields = set()
+        for pk, item in zip(pks, items):
+            instance = instances.get(pk)
+            if instance is None:
+                errors.append({pk_name: ["Not found."]})
+                objects.append(None)
+                continue
+            serializer = self.get_serializer(instance, data=item, partial=True)
+            if not serializer.is_valid():
+                errors.append(serializer.errors)
+                objects.append(None)
+                continue
+            errors.append({})
+            for name, value in serializer.validated_data.items():
+                if name != pk_name:
+                    setattr(instance, name, value)
+                    fields.add(name)
+            objects.append(instance)
+        self._check_unique(model, objects, errors)
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        if fields:
+            errors = self._save(lambda batch: model.objects.bulk_update(batch, sorted(fields)), objects)
+            if errors is not None:
+                return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+            self._bulk_written(model, objects)
+        return Response(self.get_serializer(objects, many=True).data)
+
+    def _bulk_destroy(self, items):
+        model = self.queryset.model
+        if not all(isinstance(pk, (int, str)) for pk in items):
+            return Response({'detail': "Expected a list of primary keys."}, status=status.HTTP_400_BAD_REQUEST)
+        pks = self._coerce_pks(model, items)
+        instances = self.filter_queryset(self.get_queryset()).in_bulk([pk for pk in pks if pk is not None])
+        errors = [{} if pk in instances else {'detail': "Not found."} for pk in pks]
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            model.objects.filter(pk__in=list(instances)).delete()
+        self._bulk_written(model, instances.values())
+        return Response([{'pk': pk, 'deleted': True} for pk in pks])
+
+
+class SparseFieldsetMixin:
+    """Narrows the queryset to the model fields requested using the
+    ``fields`` and ``exclude`` query parameters with ``.only()``,
+    so columns that won't be serialized aren't fetched either.
+    The serializer has to be a :class:`DynamicFieldsModelSerializer`.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        model_fields = {field.name for field in queryset.model._meta.concrete_fields}
+        requested = get_requested_fields(self.request, model_fields)
+        if requested is None:
+            return queryset
+        return queryset.only('pk', *requested)
+
+
+class StreamingListMixin:
+    """Adds an NDJSON streaming mode to the `list` action. It is used by
+    passing ``?stream=ndjson``. The queryset is then iterated in chunks of
+    :attr:`stream_chunk_size` rows using a server-side cursor, and every
+    row is sent as one line of JSON, so memory use stays flat regardless
+    of the size of the table.
+    """
+
+    stream_chunk_size = 1000
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('stream') != 'ndjson':
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset()).order_by('pk')
+        return StreamingHttpResponse(self._stream(queryset), content_type='application/x-ndjson')
+
+    def _stream(self, queryset):
+        encoder = JSONEncoder()
+        rows = queryset.iterator(chunk_size=self.stream_chunk_size)
+        while True:
+            chunk = list(islice(rows, self.stream_chunk_size))
+            if not chunk:
+                break
+            for data in self.get_serializer(chunk, many=True).data:
+                yield encoder.encode(data) + '\n'
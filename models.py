@@ -3,9 +3,10 @@ import importlib
 from django.contrib.auth.base_user import AbstractBaseUser
 from django.db import models
 
-from .controllers import BaseController
+from .controllers import get_installed_extensions
+from .profiling import profiler
 
-base = BaseController()
+profiler.start('import models')
 
 
 class User(AbstractBaseUser):
@@ -29,10 +30,10 @@ class User(AbstractBaseUser):
 class Guild(models.Model):
     # I can't normalize this any further :/
     id = models.BigIntegerField(primary_key=True)
-    name = models.CharField(max_length=64, unique=True, db_index=True)
+    name = models.CharField(max_length=100, blank=True)
     register_time = models.TimeField('date registered', auto_now=True)
-    invite_link = models.CharField(max_length=64, unique=True, db_index=True)
-    url = models.CharField(max_length=256, unique=True)
+    invite_link = models.CharField(max_length=64, blank=True)
+    url = models.CharField(max_length=256, blank=True)
     is_deleted = models.BooleanField(default=False)
 
     def __int__(self):
@@ -50,6 +51,7 @@ class Channel(models.Model):
 class Role(models.Model):
     id = models.BigIntegerField(primary_key=True)
     guild = models.ForeignKey(Guild, on_delete=models.CASCADE)
+    is_deleted = models.BooleanField(default=False)
 
     def __int__(self):
         return self.id
@@ -58,6 +60,12 @@ class Role(models.Model):
 class Member(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     guild = models.ForeignKey(Guild, on_delete=models.CASCADE)
+    is_deleted = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'guild'], name='dwarf_member_user_guild'),
+        ]
 
     def __int__(self):
         return self.id
@@ -69,6 +77,13 @@ class Message(models.Model):
     channel = models.ForeignKey(Channel, on_delete=models.CASCADE)
     content = models.TextField(max_length=2000)
     clean_content = models.TextField(max_length=2000)
+    is_deleted = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # channel history is read in ID order
+            models.Index(fields=['channel', 'id'], name='dwarf_message_channel_id'),
+        ]
 
     def __int__(self):
         return self.id
@@ -81,11 +96,12 @@ class String(models.Model):
 
 # Importing models introduced by extensions.
 # Kinda hacky but there seems to be no clean way to do this.
-extensions = base.get_extensions()
+extensions = get_installed_extensions()
 for extension in extensions:
     try:
         # mimic `from dwarf.extension.models import *`
-        models_module = importlib.import_module('dwarf.' + extension + '.models')
+        with profiler.phase('import models: ' + extension, extension=extension):
+            models_module = importlib.import_module('dwarf.' + extension + '.models')
         module_dict = models_module.__dict__
         try:
             to_import = models_module.__all__
@@ -95,3 +111,5 @@ for extension in extensions:
         globals().update({name: module_dict[name] for name in to_import})
     except ImportError:
         pass
+
+profiler.stop('import models')
@@ -0,0 +1,16 @@
+"""REST API pagination"""
+
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class SnowflakeCursorPagination(CursorPagination):
+    """Paginates by the primary key, which is a snowflake ID for most models.
+    Pages are fetched with ``WHERE pk > cursor ORDER BY pk LIMIT n`` instead
+    of an offset, so fetching a page costs the same no matter how deep it is.
+    """
+
+    ordering = 'pk'
+    page_size = getattr(settings, 'DWARF_API_PAGE_SIZE', 100)
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
@@ -0,0 +1,273 @@
+"""Range partitioning of the message table by snowflake timestamp.
+
+Message IDs are Discord snowflakes, whose upper bits are the number of
+milliseconds since the Discord epoch, so partitioning the table by ID
+range partitions it by time. Every partition holds the messages of one
+calendar month (UTC). Expired messages are removed by dropping whole
+partitions instead of deleting rows, so the table never has to be vacuumed
+after a purge, and queries filtering on IDs only scan the partitions
+the IDs fall into.
+
+Messages whose IDs fall outside every monthly partition, for example
+old messages fetched after their month was dropped, are stored in a
+DEFAULT partition instead of failing to insert. Its expired rows are
+deleted along with the expired partitions.
+
+This requires PostgreSQL 11 or newer, and PostgreSQL 12 or newer if any
+table has a foreign key to the message table.
+"""
+
+import datetime
+import re
+
+from django.conf import settings
+from django.db import NotSupportedError, connection, transaction
+
+from .models import Message
+from .versions import model_versions
+
+DISCORD_EPOCH = datetime.datetime(2015, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def snowflake_from_datetime(dt):
+    """Returns the lowest snowflake that could have been generated at a given time.
+
+    Parameters
+    ----------
+    dt : datetime.datetime
+        An aware datetime, or a naive one in UTC.
+    """
+
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return max(int((dt - DISCORD_EPOCH).total_seconds() * 1000), 0) << 22
+
+
+def datetime_from_snowflake(snowflake):
+    """Returns the time a snowflake was generated at as an aware datetime in UTC."""
+
+    return DISCORD_EPOCH + datetime.timedelta(milliseconds=snowflake >> 22)
+
+
+def _month_start(dt):
+    return datetime.datetime(dt.year, dt.month, 1, tzinfo=datetime.timezone.utc)
+
+
+def _next_month(month):
+    if month.month == 12:
+        return month.replace(year=month.year + 1, month=1)
+    return month.replace(month=month.month + 1)
+
+
+def _table():
+    return Message._meta.db_table
+
+
+def _partition_name(month):
+    return '{}_p{:04d}{:02d}'.format(_table(), month.year, month.month)
+
+
+def _default_partition_name():
+    return _table() + '_default'
+
+
+def _check_vendor():
+    if connection.vendor != 'postgresql':
+        raise NotSupportedError("message partitioning requires PostgreSQL")
+
+
+def is_partitioned():
+    """Returns whether the message table is partitioned."""
+
+    _check_vendor()
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [_table()])
+        return cursor.fetchone() is not None
+
+
+def get_partitions():
+    """Returns a dict mapping the first day of every month that has
+    a partition to the name of the partition, in chronological order."""
+
+    _check_vendor()
+    pattern = re.compile(re.escape(_table()) + r'_p(\d{4})(\d{2})$')
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT child.relname FROM pg_inherits "
+                       "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                       "WHERE pg_inherits.inhparent = %s::regclass", [_table()])
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = {}
+    for name in names:
+        match = pattern.match(name)
+        if match is not None:
+            month = datetime.datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=datetime.timezone.utc)
+            partitions[month] = name
+    return dict(sorted(partitions.items()))
+
+
+def create_partition(month):
+    """Creates the partition holding the messages of a month, unless it exists.
+
+    Parameters
+    ----------
+    month : datetime.datetime
+        Any time within the month.
+    """
+
+    month = _month_start(month)
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)".format(
+            connection.ops.quote_name(_partition_name(month)), connection.ops.quote_name(_table())),
+            [snowflake_from_datetime(month), snowflake_from_datetime(_next_month(month))])
+
+
+def create_default_partition():
+    """Creates the partition holding the messages outside every monthly partition, unless it exists."""
+
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} DEFAULT".format(
+            connection.ops.quote_name(_default_partition_name()), connection.ops.quote_name(_table())))
+
+
+def ensure_partitions(months_ahead=None):
+    """Creates the partitions for the current month and the following ones,
+    and the default partition.
+
+    Parameters
+    ----------
+    months_ahead : Optional[int]
+        How many months after the current one to create partitions for.
+        Defaults to the ``DWARF_MESSAGE_PARTITIONS_AHEAD`` setting, or 2.
+    """
+
+    if months_ahead is None:
+        months_ahead = getattr(settings, 'DWARF_MESSAGE_PARTITIONS_AHEAD', 2)
+    month = _month_start(datetime.datetime.now(datetime.timezone.utc))
+    for _ in range(months_ahead + 1):
+        create_partition(month)
+        month = _next_month(month)
+    create_default_partition()
+
+
+def drop_expired_partitions(retention_days=None):
+    """Drops the partitions whose messages are all older than the retention period
+    and returns their names.
+
+    Parameters
+    ----------
+    retention_days : Optional[int]
+        How many days messages are kept. Defaults to the
+        ``DWARF_MESSAGE_RETENTION_DAYS`` setting. If that isn't set
+        either, messages are kept forever and nothing is dropped.
+    """
+
+    if retention_days is None:
+        retention_days = getattr(settings, 'DWARF_MESSAGE_RETENTION_DAYS', None)
+        if retention_days is None:
+            return []
+
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=retention_days)
+    dropped = []
+    for month, name in get_partitions().items():
+        if _next_month(month) > cutoff:
+            break
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("ALTER TABLE {} DETACH PARTITION {}".format(
+                connection.ops.quote_name(_table()), connection.ops.quote_name(name)))
+            cursor.execute("DROP TABLE {}".format(connection.ops.quote_name(name)))
+        dropped.append(name)
+
+    purged = 0
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_class WHERE relname = %s", [_default_partition_name()])
+        if cursor.fetchone() is not None:
+            cursor.execute("DELETE FROM {} WHERE id < %s".format(
+                connection.ops.quote_name(_default_partition_name())), [snowflake_from_datetime(cutoff)])
+            purged = cursor.rowcount
+    if dropped or purged:
+        model_versions.bump(Message)
+    return dropped
+
+
+def maintain():
+    """Creates upcoming partitions and drops expired ones.
+    Returns the names of the dropped partitions.
+    Does nothing if the message table isn't partitioned."""
+
+    if not is_partitioned():
+        return []
+    ensure_partitions()
+    return drop_expired_partitions()
+
+
+def convert():
+    """Converts the message table into a partitioned table, keeping its
+    constraints, indexes and rows. Partitions are created for every month
+    from the oldest message on. Does nothing if the table is partitioned already.
+
+    The table is locked while its rows are copied, so this
+    should be run while the bot isn't running.
+
+    Foreign keys of other tables that reference the message table are
+    recreated to reference the partitioned table. PostgreSQL only supports
+    that from version 12 on, so on older versions, :exc:`NotSupportedError`
+    is raised if there are any such foreign keys.
+    """
+
+    if is_partitioned():
+        return
+
+    table = _table()
+    legacy = table + '_unpartitioned'
+    quote = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                       "WHERE confrelid = %s::regclass AND contype = 'f'", [table])
+        references = cursor.fetchall()
+        if references and connection.pg_version < 120000:
+            raise NotSupportedError(
+                "these tables have foreign keys to the message table, which can only reference a partitioned "
+                "table on PostgreSQL 12 or newer: " + ", ".join(sorted({row[0] for row in references})))
+
+        cursor.execute("LOCK TABLE {} IN ACCESS EXCLUSIVE MODE".format(quote(table)))
+        cursor.execute("SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                       "WHERE conrelid = %s::regclass", [table])
+        constraints = cursor.fetchall()
+        cursor.execute("SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT IN "
+                       "(SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)", [table, table])
+        indexes = cursor.fetchall()
+        cursor.execute("SELECT MIN(id) FROM {}".format(quote(table)))
+        oldest = cursor.fetchone()[0]
+
+        # free the names of the constraints and indexes for the new table
+        cursor.execute("ALTER TABLE {} RENAME TO {}".format(quote(table), quote(legacy)))
+        for name, _ in constraints:
+            cursor.execute("ALTER TABLE {} RENAME CONSTRAINT {} TO {}".format(
+                quote(legacy), quote(name), quote(name + '_old')))
+        for name, _ in indexes:
+            cursor.execute("ALTER INDEX {} RENAME TO {}".format(quote(name), quote(name + '_old')))
+
+        cursor.execute("CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING STORAGE) "
+                       "PARTITION BY RANGE (id)".format(quote(table), quote(legacy)))
+        for name, definition in constraints:
+            cursor.execute("ALTER TABLE {} ADD CONSTRAINT {} {}".format(quote(table), quote(name), definition))
+        for _, definition in indexes:
+            # the definitions still refer to the original table name
+            cursor.execute(definition)
+
+        month = _month_start(datetime.datetime.now(datetime.timezone.utc) if oldest is None
+                             else datetime_from_snowflake(oldest))
+        current = _month_start(datetime.datetime.now(datetime.timezone.utc))
+        while month < current:
+            create_partition(month)
+            month = _next_month(month)
+        ensure_partitions()
+
+        cursor.execute("INSERT INTO {} SELECT * FROM {}".format(quote(table), quote(legacy)))
+
+        # the definitions were read before the rename, so they reference the new table
+        for referencing_table, name, definition in references:
+            cursor.execute("ALTER TABLE {} DROP CONSTRAINT {}".format(referencing_table, quote(name)))
+            cursor.execute("ALTER TABLE {} ADD CONSTRAINT {} {}".format(referencing_table, quote(name), definition))
+        cursor.execute("DROP TABLE {}".format(quote(legacy)))
@@ -2,9 +2,71 @@
 
 from rest_framework.permissions import BasePermission
 
+from .cache import Cache
 from .models import Member
 
 
+class MembershipResolver:
+    """Resolves the IDs of the guilds the requesting user is a member of.
+    They are loaded once per request, cached in Redis until the user's
+    memberships change, and then answer every membership check with
+    a set lookup instead of a query.
+    """
+
+    timeout = 300
+
+    def __init__(self):
+        self._cache = None
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            self._cache = Cache()
+        return self._cache
+
+    @staticmethod
+    def _key(user_id):
+        return 'member_guilds_' + str(user_id)
+
+    def get_guild_ids(self, request):
+        """Returns the IDs of the guilds the requesting user is a member of as a frozenset."""
+
+        guild_ids = getattr(request, '_dwarf_guild_ids', None)
+        if guild_ids is not None:
+            return guild_ids
+
+        if not request.user.is_authenticated:
+            guild_ids = frozenset()
+        else:
+            key = self._key(request.user.pk)
+            guild_ids = self.cache.get(key)
+            if guild_ids is None:
+                guild_ids = frozenset(Member.objects.filter(user_id=request.user.pk, is_deleted=False)
+                                      .values_list('guild_id', flat=True))
+                self.cache.set(key, guild_ids, timeout=self.timeout)
+        request._dwarf_guild_ids = guild_ids
+        return guild_ids
+
+    def is_member(self, request, guild_id):
+        """Checks whether the requesting user is a member of a guild."""
+
+        return guild_id in self.get_guild_ids(request)
+
+    def invalidate(self, user_ids):
+        """Drops the cached guild IDs of users whose memberships changed.
+
+        Parameters
+        ----------
+        user_ids : iter of int
+            The IDs of the users.
+        """
+
+        self.cache.delete_many([self._key(user_id) for user_id in set(user_ids)])
+
+
+memberships = MembershipResolver()
+
+
 class GuildPermissions(BasePermission):
     def has_permission(self, request, view):
         return (request.user.is_superuser or
@@ -13,7 +75,7 @@ class GuildPermissions(BasePermission):
 
     def has_object_permission(self, request, view, obj):
         return (request.user.is_superuser or request.user.is_staff or
-                Member.objects.filter(user=request.user, guild=obj).exists())
+                memberships.is_member(request, obj.id))
 
 
 class StringPermissions(BasePermission):
@@ -48,7 +110,7 @@ class MemberPermissions(BasePermission):
     def has_object_permission(self, request, view, obj):
         return (request.user.is_superuser or
                 request.user.is_staff or
-                Member.objects.filter(user=request.user, guild=obj.guild).exists())
+                memberships.is_member(request, obj.guild_id))
 
 
 class RolePermissions(BasePermission):
@@ -60,7 +122,7 @@ class RolePermissions(BasePermission):
     def has_object_permission(self, request, view, obj):
         return (request.user.is_superuser or
                 request.user.is_staff or
-                Member.objects.filter(user=request.user, guild=obj.guild).exists())
+                memberships.is_member(request, obj.guild_id))
 
 
 class ChannelPermissions(BasePermission):
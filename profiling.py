@@ -0,0 +1,156 @@
+"""Measuring how long starting Dwarf takes and how much memory it uses."""
+
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from . import DWARF_ROOT
+
+log = logging.getLogger('dwarf.profiling')
+
+
+class StartupBudgetExceeded(Exception):
+    pass
+
+
+class StartupProfiler:
+    """Records the wall time and memory allocations of the phases of
+    starting Dwarf, like importing the models of every extension,
+    loading every extension's cogs and logging into Discord.
+
+    Wall times are always recorded because doing so is cheap. Memory is only
+    recorded once :meth:`enable` has been called, which starts tracing
+    allocations, and only for phases that don't run concurrently with others,
+    since allocations are traced for the whole process. Profiling is enabled
+    from the start if the ``DWARF_PROFILE_STARTUP`` setting is ``True``;
+    ``startbot --profile`` enables it after Django has been set up, so the
+    phases before that lack memory figures.
+
+    The bot calls :meth:`finish` once it's connected to Discord, web workers
+    once they receive their first request. A JSON report is then written to
+    the path set by ``DWARF_STARTUP_REPORT`` (defaults to
+    ``startup_profile.{pid}.json`` in Dwarf's directory; ``{pid}`` is replaced
+    with the ID of the process, so workers don't overwrite each other's
+    reports) and the phases are compared against ``DWARF_STARTUP_BUDGET``.
+    The budget is either a number of seconds the whole startup may take, or
+    a dict mapping phase names (and ``'total'``) to numbers of seconds.
+    Exceeding it logs a warning, or raises :exc:`StartupBudgetExceeded` if
+    ``DWARF_STARTUP_BUDGET_ACTION`` is ``'fail'``.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.enabled = False
+        self.finished = False
+        self.phases = []
+        self._running = {}
+        self._started_tracing = False
+
+    def enable(self):
+        """Starts tracing memory allocations and makes :meth:`finish` write a report."""
+
+        if not self.enabled:
+            self.enabled = True
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+
+    def start(self, name, memory=True, **extra):
+        """Starts timing a phase. ``extra`` is included in the report.
+        Pass ``memory=False`` for phases that run concurrently with others."""
+
+        memory = tracemalloc.get_traced_memory()[0] if memory and tracemalloc.is_tracing() else None
+        self._running[name] = (time.perf_counter(), memory, extra)
+
+    def stop(self, name):
+        """Stops timing a phase that was started with :meth:`start`."""
+
+        try:
+            started, memory, extra = self._running.pop(name)
+        except KeyError:
+            return
+        phase = {
+            'name': name,
+            'offset': started - self.started,
+            'wall_time': time.perf_counter() - started,
+            'memory': None,
+        }
+        if memory is not None and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            phase['memory'] = {'allocated': current - memory, 'peak': peak}
+        phase.update(extra)
+        self.phases.append(phase)
+
+    @contextmanager
+    def phase(self, name, memory=True, **extra):
+        """A context manager that times the code it wraps as a phase."""
+
+        self.start(name, memory=memory, **extra)
+        try:
+            yield
+        finally:
+            self.stop(name)
+
+    def report(self):
+        """Returns the recorded phases and the total startup time as a dict."""
+
+        return {
+            'argv': sys.argv,
+            'pid': os.getpid(),
+            'total': time.perf_counter() - self.started,
+            'phases': sorted(self.phases, key=lambda phase: phase['offset']),
+        }
+
+    def check_budget(self, report):
+        """Returns a list of descriptions of the phases that exceeded the budget."""
+
+        budget = getattr(settings, 'DWARF_STARTUP_BUDGET', None)
+        if budget is None:
+            return []
+        if not isinstance(budget, dict):
+            budget = {'total': budget}
+
+        times = {'total': report['total']}
+        for phase in report['phases']:
+            times[phase['name']] = times.get(phase['name'], 0) + phase['wall_time']
+        return ["{} took {:.3f}s (budget: {}s)".format(name, times[name], limit)
+                for name, limit in budget.items() if name in times and times[name] > limit]
+
+    def finish(self):
+        """Writes the report and checks the budget if profiling is enabled.
+        Only does something the first time it's called.
+
+        Raises
+        ------
+        StartupBudgetExceeded
+            The budget was exceeded and ``DWARF_STARTUP_BUDGET_ACTION`` is ``'fail'``.
+        """
+
+        if not self.enabled or self.finished:
+            return None
+        self.finished = True
+
+        report = self.report()
+        path = getattr(settings, 'DWARF_STARTUP_REPORT', os.path.join(DWARF_ROOT, 'startup_profile.{pid}.json'))
+        with open(path.format(pid=os.getpid()), 'w', encoding='utf-8') as report_file:
+            json.dump(report, report_file, indent=2)
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+        exceeded = self.check_budget(report)
+        if exceeded:
+            if getattr(settings, 'DWARF_STARTUP_BUDGET_ACTION', 'warn') == 'fail':
+                raise StartupBudgetExceeded("startup budget exceeded: " + "; ".join(exceeded))
+            for description in exceeded:
+                log.warning("startup budget exceeded: %s", description)
+        return report
+
+
+profiler = StartupProfiler()
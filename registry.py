@@ -0,0 +1,245 @@
+"""Remembering which Discord entities already have rows in the database."""
+
+import threading
+
+from django.db import transaction
+
+from .models import User, Guild, Channel, Role, Member
+from .permissions import memberships
+from .versions import model_versions
+
+
+class EntityRegistry:
+    """Remembers the IDs of the users, guilds, channels, roles and members
+    that are known to exist in the database, so repeated lookups cost a
+    set membership test instead of a query.
+
+    The ``get_*`` methods always return rows that exist in the database:
+    the first lookup of an ID the registry doesn't know yet creates the
+    row if it's missing. Code that writes many rows at once, like the
+    message archive, uses the ``ensure_*`` methods instead, which queue
+    the missing rows; :meth:`flush` inserts all queued objects in bulk.
+    """
+
+    # parents have to be inserted before the rows referencing them
+    MODELS = (User, Guild, Channel, Role, Member)
+
+    def __init__(self):
+        self._known = {model: set() for model in self.MODELS if model is not Member}
+        # (user ID, guild ID) -> member ID
+        self._members = {}
+        self._pending = {model: {} for model in self.MODELS}
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self):
+        """The number of objects waiting to be inserted."""
+
+        return sum(len(objects) for objects in self._pending.values())
+
+    def mark_known(self, model, ids):
+        """Records that rows with the given IDs exist in the database.
+
+        Parameters
+        ----------
+        model
+            The model class of the rows.
+        ids : iter of int
+            The IDs of the rows. For :class:`Member` rows, these
+            have to be (user ID, guild ID, member ID) tuples.
+        """
+
+        with self._lock:
+            if model is Member:
+                for user_id, guild_id, member_id in ids:
+                    self._members[(user_id, guild_id)] = member_id
+            else:
+                self._known[model].update(ids)
+
+    def forget(self, model, ids):
+        """Removes IDs from the registry, for example because their rows were deleted.
+
+        Parameters
+        ----------
+        model
+            The model class of the rows.
+        ids : iter of int
+            The IDs of the rows. For :class:`Member` rows, these
+            have to be (user ID, guild ID) tuples.
+        """
+
+        with self._lock:
+            for _id in ids:
+                if model is Member:
+                    self._members.pop(_id, None)
+                else:
+                    self._known[model].discard(_id)
+                self._pending[model].pop(_id, None)
+
+    def get_user(self, user_id):
+        return self._get(User, user_id)
+
+    def get_guild(self, guild_id):
+        return self._get(Guild, guild_id)
+
+    def get_channel(self, channel_id, guild_id):
+        self.get_guild(guild_id)
+        return self._get(Channel, channel_id, guild_id=guild_id)
+
+    def get_role(self, role_id, guild_id):
+        self.get_guild(guild_id)
+        return self._get(Role, role_id, guild_id=guild_id)
+
+    def get_member(self, user_id, guild_id):
+        self.get_user(user_id)
+        self.get_guild(guild_id)
+        key = (user_id, guild_id)
+        with self._lock:
+            member_id = self._members.get(key)
+            if member_id is not None:
+                return Member.from_db(None, ['id', 'user_id', 'guild_id'], [member_id, user_id, guild_id])
+            # the member is created right away instead of by the next flush
+            self._pending[Member].pop(key, None)
+
+        member = self._restore(Member.objects.get_or_create(user_id=user_id, guild_id=guild_id)[0])
+        with self._lock:
+            self._members[key] = member.id
+        return member
+
+    def ensure_users(self, user_ids):
+        """Makes sure rows for all given user IDs exist or are queued,
+        using a single query for the IDs the registry doesn't know yet.
+
+        Parameters
+        ----------
+        user_ids : iter of int
+            The IDs of the users.
+        """
+
+        self._ensure(User, {user_id: {} for user_id in user_ids})
+
+    def ensure_channels(self, channels):
+        """Makes sure rows for all given channels and their guilds exist or are queued,
+        using a single query per model for the IDs the registry doesn't know yet.
+
+        Parameters
+        ----------
+        channels : dict
+            A dict mapping channel IDs to the IDs of their guilds.
+        """
+
+        self._ensure(Guild, {guild_id: {} for guild_id in channels.values()})
+        self._ensure(Channel, {channel_id: {'guild_id': guild_id} for channel_id, guild_id in channels.items()})
+
+    def _ensure(self, model, objects):
+        with self._lock:
+            unknown = [_id for _id in objects if _id not in self._known[model] and _id not in self._pending[model]]
+        if not unknown:
+            return
+
+        existing = set(model.objects.filter(id__in=unknown).values_list('id', flat=True))
+        with self._lock:
+            self._known[model].update(existing)
+            for _id in unknown:
+                if _id not in existing:
+                    self._pending[model].setdefault(_id, model(id=_id, **objects[_id]))
+
+    def _get(self, model, _id, **fields):
+        field_names = ['id'] + [name + '_id' for name in fields]
+        values = [_id] + list(fields.values())
+        with self._lock:
+            if _id in self._known[model]:
+                # fields that weren't given are deferred and loaded on access
+                return model.from_db(None, field_names, values)
+            # the row is created right away instead of by the next flush
+            self._pending[model].pop(_id, None)
+
+        fields = {name + '_id': value for name, value in fields.items()}
+        instance = self._restore(model.objects.get_or_create(id=_id, defaults=fields)[0])
+        with self._lock:
+            self._known[model].add(_id)
+        return instance
+
+    @staticmethod
+    def _restore(instance):
+        # the object was looked up because it exists on Discord,
+        # so it can't be deleted anymore
+        if getattr(instance, 'is_deleted', False):
+            type(instance).objects.filter(pk=instance.pk).update(is_deleted=False)
+            instance.is_deleted = False
+            model_versions.bump(type(instance))
+            if isinstance(instance, Member):
+                memberships.invalidate([instance.user_id])
+        return instance
+
+    @staticmethod
+    def _existing_members(keys):
+        """Returns the IDs of members that were inserted by someone else
+        since they were queued, keyed by their (user ID, guild ID) pair."""
+
+        user_ids = {user_id for user_id, _ in keys}
+        guild_ids = {guild_id for _, guild_id in keys}
+        return {(user_id, guild_id): member_id for member_id, user_id, guild_id in
+                Member.objects.filter(user_id__in=user_ids, guild_id__in=guild_ids)
+                .values_list('id', 'user_id', 'guild_id')
+                if (user_id, guild_id) in keys}
+
+    def flush(self):
+        """Inserts all queued objects into the database in bulk."""
+
+        with self._lock:
+            pending, self._pending = self._pending, {model: {} for model in self.MODELS}
+
+        if not any(pending.values()):
+            return
+
+        try:
+            with transaction.atomic():
+                for model in self.MODELS:
+                    objects = list(pending[model].values())
+                    if not objects:
+                        continue
+                    if model is Member:
+                        # members are identified by their (user, guild) pair, so
+                        # their generated IDs have to be returned by the insert,
+                        # which rules out ignore_conflicts
+                        existing = self._existing_members(pending[Member])
+                        for key, member_id in existing.items():
+                            pending[Member][key].id = member_id
+                        Member.objects.bulk_create([member for key, member in pending[Member].items()
+                                                    if key not in existing])
+                    else:
+                        model.objects.bulk_create(objects, ignore_conflicts=True)
+        except Exception:
+            with self._lock:
+                for model, objects in pending.items():
+                    for key, instance in objects.items():
+                        self._pending[model].setdefault(key, instance)
+            raise
+
+        # bulk inserts don't send signals
+        model_versions.bump(*(model for model in self.MODELS if pending[model]))
+        if pending[Member]:
+            memberships.invalidate(user_id for user_id, _ in pending[Member])
+
+        with self._lock:
+            for model, objects in pending.items():
+                if model is Member:
+                    for (user_id, guild_id), member in objects.items():
+                        self._members[(user_id, guild_id)] = member.id
+                else:
+                    self._known[model].update(objects)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Returns the :class:`EntityRegistry` shared by the whole process."""
+
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = EntityRegistry()
+    return _registry
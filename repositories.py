@@ -0,0 +1,250 @@
+"""A local cache of the Git repositories extensions are installed from."""
+
+import asyncio
+import hashlib
+import os
+import shutil
+import subprocess
+import uuid
+
+from django.conf import settings
+
+
+class RepositoryError(Exception):
+    pass
+
+
+class RepositoryCache:
+    """Keeps a bare mirror of every repository an extension was installed
+    from, so that installing, reinstalling and rolling back an extension
+    only needs the network to fetch commits that aren't cached yet.
+
+    Working copies are cloned from the mirrors with ``git clone --local``,
+    which hardlinks the objects instead of copying them, so several Dwarf
+    instances on one host share the disk space of a mirror if they share the
+    cache directory. A working copy can be reset to any commit it had
+    before without the network. The commits a working copy was at before
+    each of its updates are recorded in its Git directory, so repeated
+    rollbacks go back one update at a time.
+
+    Every operation is available as a blocking method and as a coroutine
+    that runs Git as an asyncio subprocess (prefixed with ``a``).
+
+    Parameters
+    ----------
+    root : Optional[str]
+        The directory the mirrors are kept in. Defaults to the
+        ``DWARF_REPOSITORY_CACHE`` setting, or ``~/.cache/dwarf/repositories``.
+        Setting ``DWARF_REPOSITORY_CACHE`` to ``None`` makes
+        :class:`BaseController` clone from the network directly.
+    depth : Optional[int]
+        If given, mirrors are created by shallow clones of this many commits,
+        which is faster for big repositories but limits how far back extensions
+        can be rolled back, and Git copies the objects of shallow mirrors into
+        working copies instead of hardlinking them. Servers that don't support
+        shallow clones are cloned from in full instead. Defaults to the
+        ``DWARF_REPOSITORY_DEPTH`` setting, or ``None``.
+    """
+
+    def __init__(self, root=None, depth=None):
+        if root is None:
+            root = getattr(settings, 'DWARF_REPOSITORY_CACHE',
+                           os.path.join(os.path.expanduser('~'), '.cache', 'dwarf', 'repositories'))
+        if depth is None:
+            depth = getattr(settings, 'DWARF_REPOSITORY_DEPTH', None)
+        self.root = root
+        self.depth = depth
+
+    def mirror_path(self, url):
+        """Returns the path of the mirror of a repository."""
+
+        return os.path.join(self.root, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.git')
+
+    # The operations are generators that yield the Git commands to run
+    # and receive their exit codes and output, so that the blocking and
+    # the asynchronous variants share their logic.
+
+    def _update_mirror(self, url):
+        path = self.mirror_path(url)
+        depth = () if self.depth is None else ('--depth', str(self.depth))
+        if os.path.isdir(path):
+            # fetching without a depth only fetches the commits since the
+            # last fetch, so the history of a shallow mirror stays connected
+            code, output = yield ('git', '-C', path, 'fetch', '-q', '--prune', 'origin')
+            if code != 0:
+                raise RepositoryError('could not fetch repository "{}": {}'.format(url, output.strip()))
+            return path
+
+        os.makedirs(self.root, exist_ok=True)
+        # clone next to the final path, so other instances never see a partial mirror
+        temp_path = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+        code, output = yield ('git', 'clone', '-q', '--mirror') + depth + (url, temp_path)
+        if code != 0 and depth:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            code, output = yield ('git', 'clone', '-q', '--mirror', url, temp_path)
+        if code != 0:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            raise RepositoryError('could not clone repository "{}": {}'.format(url, output.strip()))
+        try:
+            os.rename(temp_path, path)
+        except OSError:
+            # another instance created the mirror in the meantime
+            shutil.rmtree(temp_path, ignore_errors=True)
+        return path
+
+    def _checkout(self, url, destination, revision=None):
+        mirror = yield from self._update_mirror(url)
+        code, output = yield ('git', 'clone', '-q', '--local', mirror, destination)
+        if code != 0:
+            raise RepositoryError('could not check out repository "{}": {}'.format(url, output.strip()))
+        if revision is not None:
+            code, output = yield ('git', '-C', destination, 'checkout', '-q', revision)
+            if code != 0:
+                raise RepositoryError('could not check out revision "{}": {}'.format(revision, output.strip()))
+        return (yield from self._head(destination))
+
+    def _update(self, url, destination):
+        yield from self._update_mirror(url)
+        # working copies that were cloned before the cache existed
+        # are pointed at the mirror, so pulling doesn't hit the network
+        code, output = yield ('git', '-C', destination, 'remote', 'set-url', 'origin', self.mirror_path(url))
+        if code != 0:
+            raise RepositoryError('could not update "{}": {}'.format(destination, output.strip()))
+        return (yield from self._pull(destination, 'origin'))
+
+    def _pull(self, destination, remote):
+        old_revision = yield from self._head(destination)
+        code, output = yield ('git', '-C', destination, 'pull', '-q', '--ff-only', remote)
+        if code != 0:
+            raise RepositoryError('could not update "{}": {}'.format(destination, output.strip()))
+        new_revision = yield from self._head(destination)
+        if new_revision != old_revision:
+            history_path = yield from self._history_path(destination)
+            self._write_history(history_path, self._read_history(history_path) + [old_revision])
+        return old_revision, new_revision
+
+    def _rollback(self, destination, revision=None):
+        history_path = yield from self._history_path(destination)
+        history = self._read_history(history_path)
+        if revision is not None:
+            target = revision
+        elif history:
+            target = history[-1]
+        else:
+            raise RepositoryError('"{}" has no update to roll back'.format(destination))
+        code, output = yield ('git', '-C', destination, 'reset', '-q', '--hard', target)
+        if code != 0:
+            raise RepositoryError('could not roll back "{}" to "{}": {}'.format(
+                destination, target, output.strip()))
+        if revision is None:
+            self._write_history(history_path, history[:-1])
+        return (yield from self._head(destination))
+
+    @staticmethod
+    def _history_path(destination):
+        code, output = yield ('git', '-C', destination, 'rev-parse', '--git-path', 'dwarf-history')
+        if code != 0:
+            raise RepositoryError('"{}" is not a Git repository: {}'.format(destination, output.strip()))
+        return os.path.join(destination, output.strip())
+
+    @staticmethod
+    def _read_history(path):
+        try:
+            with open(path, encoding='utf-8') as history_file:
+                return history_file.read().split()
+        except FileNotFoundError:
+            return []
+
+    @staticmethod
+    def _write_history(path, history):
+        with open(path, 'w', encoding='utf-8') as history_file:
+            history_file.write(''.join(revision + '\n' for revision in history))
+
+    @staticmethod
+    def _head(destination):
+        code, output = yield ('git', '-C', destination, 'rev-parse', 'HEAD')
+        if code != 0:
+            raise RepositoryError('"{}" is not a Git repository: {}'.format(destination, output.strip()))
+        return output.strip()
+
+    @staticmethod
+    def _drive(operation):
+        try:
+            command = next(operation)
+            while True:
+                process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                command = operation.send((process.returncode, process.stdout.decode(errors='replace')))
+        except StopIteration as result:
+            return result.value
+
+    @staticmethod
+    async def _adrive(operation, loop=None):
+        try:
+            command = next(operation)
+            while True:
+                process = await asyncio.create_subprocess_exec(*command, stdout=subprocess.PIPE,
+                                                               stderr=subprocess.STDOUT, loop=loop)
+                output, _ = await process.communicate()
+                command = operation.send((process.returncode, output.decode(errors='replace')))
+        except StopIteration as result:
+            return result.value
+
+    def update_mirror(self, url):
+        """Creates or updates the mirror of a repository and returns its path."""
+
+        return self._drive(self._update_mirror(url))
+
+    def checkout(self, url, destination, revision=None):
+        """Clones a repository from its mirror into a directory that must not
+        exist yet, and returns the commit that was checked out.
+
+        Parameters
+        ----------
+        url : str
+            The URL of the repository. ``file://`` URLs and paths work too.
+        destination : str
+            The directory to clone into.
+        revision : Optional[str]
+            The commit, branch or tag to check out. Defaults to the default branch.
+        """
+
+        return self._drive(self._checkout(url, destination, revision))
+
+    def update(self, url, destination):
+        """Updates the mirror of a repository and fast-forwards a working copy
+        from it. Returns the commits checked out before and after."""
+
+        return self._drive(self._update(url, destination))
+
+    def pull(self, destination, remote):
+        """Fast-forwards a working copy from a remote without using the cache,
+        recording the update like :meth:`update` does. Returns the commits
+        checked out before and after."""
+
+        return self._drive(self._pull(destination, remote))
+
+    def rollback(self, destination, revision=None):
+        """Resets a working copy to a commit and returns that commit.
+
+        By default, the working copy is reset to the commit it was at before
+        its last update that wasn't rolled back yet, so every rollback undoes
+        one more update. Raises :exc:`RepositoryError` if there is none.
+        Resetting to an explicit revision doesn't change which updates are
+        undone by later rollbacks."""
+
+        return self._drive(self._rollback(destination, revision))
+
+    async def aupdate_mirror(self, url, loop=None):
+        return await self._adrive(self._update_mirror(url), loop=loop)
+
+    async def acheckout(self, url, destination, revision=None, loop=None):
+        return await self._adrive(self._checkout(url, destination, revision), loop=loop)
+
+    async def aupdate(self, url, destination, loop=None):
+        return await self._adrive(self._update(url, destination), loop=loop)
+
+    async def apull(self, destination, remote, loop=None):
+        return await self._adrive(self._pull(destination, remote), loop=loop)
+
+    async def arollback(self, destination, revision=None, loop=None):
+        return await self._adrive(self._rollback(destination, revision), loop=loop)
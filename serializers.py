@@ -3,7 +3,48 @@ from rest_framework import serializers
 from .models import Guild, Channel, Role, Member, Message, String
 
 
-class GuildSerializer(serializers.ModelSerializer):
+def get_requested_fields(request, field_names):
+    """Returns the names of the fields that were requested using the
+    ``fields`` and ``exclude`` query parameters (comma-separated lists),
+    or ``None`` if neither was given or the request isn't a read.
+
+    Parameters
+    ----------
+    request
+        The REST framework request.
+    field_names : iter of str
+        The names of all fields that are available.
+    """
+
+    if request is None or request.method not in ('GET', 'HEAD'):
+        return None
+    fields = request.query_params.get('fields')
+    exclude = request.query_params.get('exclude')
+    if not fields and not exclude:
+        return None
+
+    requested = set(field_names)
+    if fields:
+        requested &= {name.strip() for name in fields.split(',')}
+    if exclude:
+        requested -= {name.strip() for name in exclude.split(',')}
+    return requested
+
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """A model serializer that only includes the fields requested using
+    the ``fields`` and ``exclude`` query parameters when reading."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        requested = get_requested_fields(self.context.get('request'), self.fields)
+        if requested is not None:
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+
+
+class GuildSerializer(DynamicFieldsModelSerializer):
     """Serializes the Guild model"""
 
     class Meta:
@@ -11,7 +52,7 @@ class GuildSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class ChannelSerializer(serializers.ModelSerializer):
+class ChannelSerializer(DynamicFieldsModelSerializer):
     """Serializes the Channel model"""
 
     class Meta:
@@ -19,7 +60,7 @@ class ChannelSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class RoleSerializer(serializers.ModelSerializer):
+class RoleSerializer(DynamicFieldsModelSerializer):
     """Serializes the Role model"""
 
     class Meta:
@@ -27,7 +68,7 @@ class RoleSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class MemberSerializer(serializers.ModelSerializer):
+class MemberSerializer(DynamicFieldsModelSerializer):
     """Serializes the Member model"""
 
     class Meta:
@@ -35,7 +76,7 @@ class MemberSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class MessageSerializer(serializers.ModelSerializer):
+class MessageSerializer(DynamicFieldsModelSerializer):
     """Serializes the Message model"""
 
     class Meta:
@@ -43,7 +84,7 @@ class MessageSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class StringSerializer(serializers.ModelSerializer):
+class StringSerializer(DynamicFieldsModelSerializer):
     """Serializes the String model"""
 
     class Meta:
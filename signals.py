@@ -0,0 +1,61 @@
+"""Model signal receivers"""
+
+from django.db import connections, transaction
+from django.db.models import Count, Min
+from django.db.models.signals import post_delete, post_save, pre_migrate
+from django.dispatch import receiver
+
+from .models import Guild, Channel, Role, Member, Message, String
+from .permissions import memberships
+from .versions import model_versions
+
+
+@receiver(post_save, sender=Member)
+@receiver(post_delete, sender=Member)
+def invalidate_memberships(sender, instance, **kwargs):
+    memberships.invalidate([instance.user_id])
+
+
+def bump_model_version(sender, **kwargs):
+    model_versions.bump(sender)
+
+
+for _model in (Guild, Channel, Role, Member, Message, String):
+    post_save.connect(bump_model_version, sender=_model)
+    post_delete.connect(bump_model_version, sender=_model)
+
+
+@receiver(pre_migrate)
+def merge_duplicate_members(sender, app_config=None, using='default', **kwargs):
+    """Merges the members that share a user and a guild before the unique
+    constraint on them is added. Rows referencing a duplicate are pointed at
+    the member with the lowest ID, then the duplicates are deleted.
+    Only the columns that existed before the constraint are queried,
+    because the table hasn't been migrated yet."""
+
+    if app_config is None or app_config.label != 'dwarf':
+        return
+    connection = connections[using]
+    tables = set(connection.introspection.table_names())
+    if Member._meta.db_table not in tables:
+        return
+
+    groups = (Member.objects.using(using).order_by().values('user_id', 'guild_id')
+              .annotate(count=Count('id'), keep=Min('id')).filter(count__gt=1))
+    for group in groups:
+        with transaction.atomic(using=using):
+            duplicates = list(Member.objects.using(using)
+                              .filter(user_id=group['user_id'], guild_id=group['guild_id'])
+                              .exclude(id=group['keep']).values_list('id', flat=True))
+            for relation in Member._meta.get_fields(include_hidden=True):
+                if not ((relation.one_to_many or relation.one_to_one) and relation.auto_created
+                        and not relation.concrete):
+                    continue
+                if relation.related_model._meta.db_table in tables:
+                    (relation.related_model._base_manager.using(using)
+                     .filter(**{relation.field.attname + '__in': duplicates})
+                     .update(**{relation.field.attname: group['keep']}))
+            with connection.cursor() as cursor:
+                cursor.execute("DELETE FROM {} WHERE id IN ({})".format(
+                    connection.ops.quote_name(Member._meta.db_table), ", ".join(["%s"] * len(duplicates))),
+                    duplicates)
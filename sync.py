@@ -0,0 +1,189 @@
+"""Synchronizing the database with the guilds a bot is connected to."""
+
+import discord
+from django.conf import settings
+from django.db import transaction
+
+from .db import get_executor
+from .models import User, Guild, Channel, Role, Member
+from .permissions import memberships
+from .registry import get_registry
+from .versions import model_versions
+
+
+def _chunks(sequence, size):
+    for i in range(0, len(sequence), size):
+        yield sequence[i:i + size]
+
+
+class GuildSynchronizer:
+    """Brings the `Guild`, `Channel`, `Role` and `Member` tables in line with
+    the guilds a bot is connected to, using chunked bulk queries.
+
+    Missing rows are inserted, changed guild names are updated, and
+    guilds the bot is no longer in as well as roles and members that no
+    longer exist are marked as deleted instead of being deleted, so rows
+    of extensions that reference them are kept. Channels are never
+    marked as deleted because messages are stored for them.
+
+    Parameters
+    ----------
+    bot
+        The bot whose guilds are synchronized.
+    chunk_size : Optional[int]
+        The number of guilds synchronized per transaction. Defaults to the
+        ``DWARF_SYNC_CHUNK_SIZE`` setting, or 100 if it isn't set.
+    progress : Optional[Callable]
+        Called with the number of synchronized guilds and the total number
+        of guilds after every chunk. Defaults to printing the progress.
+    """
+
+    def __init__(self, bot, chunk_size=None, progress=None):
+        self.bot = bot
+        if chunk_size is None:
+            chunk_size = getattr(settings, 'DWARF_SYNC_CHUNK_SIZE', 100)
+        self.chunk_size = chunk_size
+        self.progress = self._print_progress if progress is None else progress
+
+    @staticmethod
+    def _print_progress(done, total):
+        print("Synchronized {} of {} guilds".format(done, total))
+
+    async def sync(self, guilds=None):
+        """Synchronizes guilds with the database.
+
+        Parameters
+        ----------
+        guilds : Optional[iter of discord.Guild]
+            The guilds to synchronize. Defaults to all guilds the bot is in,
+            in which case guilds the bot has left are marked as deleted.
+            Unavailable guilds are skipped until they become available.
+        """
+
+        full = guilds is None
+        if full:
+            guilds = self.bot.guilds
+        guilds = list(guilds)
+        # unavailable guilds have no name, roles or members yet, so they're
+        # left alone, but they aren't guilds the bot has left either
+        unavailable = {guild.id for guild in guilds if guild.unavailable}
+        # discord.py mutates its state on the event loop,
+        # so take a snapshot before handing it to a worker thread
+        snapshot = [{
+            'id': guild.id,
+            'name': guild.name,
+            'channels': [channel.id for channel in guild.channels if isinstance(channel, discord.TextChannel)],
+            'roles': [role.id for role in guild.roles],
+            'members': [member.id for member in guild.members],
+        } for guild in guilds if guild.id not in unavailable]
+        await get_executor().run(self._apply, snapshot, full, unavailable, loop=self.bot.loop)
+
+    def _apply(self, snapshot, full, unavailable=()):
+        total = len(snapshot)
+        done = 0
+        for chunk in _chunks(snapshot, self.chunk_size):
+            with transaction.atomic():
+                self._sync_chunk(chunk)
+            done += len(chunk)
+            self.progress(done, total)
+
+        if full:
+            self._mark_deleted({guild['id'] for guild in snapshot} | set(unavailable))
+        # bulk queries don't send signals
+        model_versions.bump(Guild, Channel, Role, Member)
+
+    def _sync_chunk(self, chunk):
+        registry = get_registry()
+        guild_ids = [guild['id'] for guild in chunk]
+
+        # guilds
+        existing = {_id: (name, is_deleted) for _id, name, is_deleted in
+                    Guild.objects.filter(id__in=guild_ids).values_list('id', 'name', 'is_deleted')}
+        new_guilds = []
+        changed_guilds = []
+        for guild in chunk:
+            if guild['id'] not in existing:
+                new_guilds.append(Guild(id=guild['id'], name=guild['name']))
+            elif existing[guild['id']] != (guild['name'], False):
+                changed_guilds.append(Guild(id=guild['id'], name=guild['name'], is_deleted=False))
+        Guild.objects.bulk_create(new_guilds, ignore_conflicts=True)
+        Guild.objects.bulk_update(changed_guilds, ['name', 'is_deleted'])
+        registry.mark_known(Guild, guild_ids)
+
+        # users
+        user_ids = list({user_id for guild in chunk for user_id in guild['members']})
+        for user_ids_chunk in _chunks(user_ids, 1000):
+            existing = set(User.objects.filter(id__in=user_ids_chunk).values_list('id', flat=True))
+            User.objects.bulk_create([User(id=user_id) for user_id in user_ids_chunk if user_id not in existing],
+                                     ignore_conflicts=True)
+        registry.mark_known(User, user_ids)
+
+        # channels
+        existing = set(Channel.objects.filter(guild_id__in=guild_ids).values_list('id', flat=True))
+        Channel.objects.bulk_create([Channel(id=channel_id, guild_id=guild['id'])
+                                     for guild in chunk for channel_id in guild['channels']
+                                     if channel_id not in existing], ignore_conflicts=True)
+        registry.mark_known(Channel, [channel_id for guild in chunk for channel_id in guild['channels']])
+
+        # roles
+        current = {role_id for guild in chunk for role_id in guild['roles']}
+        existing = dict(Role.objects.filter(guild_id__in=guild_ids).values_list('id', 'is_deleted'))
+        Role.objects.bulk_create([Role(id=role_id, guild_id=guild['id'])
+                                  for guild in chunk for role_id in guild['roles']
+                                  if role_id not in existing], ignore_conflicts=True)
+        stale = [role_id for role_id, is_deleted in existing.items() if role_id not in current and not is_deleted]
+        restored = [role_id for role_id, is_deleted in existing.items() if role_id in current and is_deleted]
+        if stale:
+            Role.objects.filter(id__in=stale).update(is_deleted=True)
+            registry.forget(Role, stale)
+        if restored:
+            Role.objects.filter(id__in=restored).update(is_deleted=False)
+        registry.mark_known(Role, current)
+
+        # members
+        current = {(user_id, guild['id']) for guild in chunk for user_id in guild['members']}
+        existing = {(user_id, guild_id): (member_id, is_deleted) for member_id, user_id, guild_id, is_deleted in
+                    Member.objects.filter(guild_id__in=guild_ids)
+                    .values_list('id', 'user_id', 'guild_id', 'is_deleted')}
+        new_members = [Member(user_id=user_id, guild_id=guild_id)
+                       for user_id, guild_id in current if (user_id, guild_id) not in existing]
+        # the registry may insert the same members meanwhile, so conflicts are skipped
+        # and the IDs are read back, since bulk_create doesn't set them then
+        Member.objects.bulk_create(new_members, ignore_conflicts=True)
+        new_keys = {(member.user_id, member.guild_id) for member in new_members}
+        created = []
+        if new_keys:
+            created = [(user_id, guild_id, member_id) for member_id, user_id, guild_id in
+                       Member.objects.filter(guild_id__in={guild_id for _, guild_id in new_keys},
+                                             user_id__in={user_id for user_id, _ in new_keys})
+                       .values_list('id', 'user_id', 'guild_id')
+                       if (user_id, guild_id) in new_keys]
+        stale = [key for key, (_, is_deleted) in existing.items() if key not in current and not is_deleted]
+        restored = [key for key, (_, is_deleted) in existing.items() if key in current and is_deleted]
+        if stale:
+            Member.objects.filter(id__in=[existing[key][0] for key in stale]).update(is_deleted=True)
+            registry.forget(Member, stale)
+        if restored:
+            Member.objects.filter(id__in=[existing[key][0] for key in restored]).update(is_deleted=False)
+        registry.mark_known(Member, [(user_id, guild_id, member_id)
+                                     for (user_id, guild_id), (member_id, _) in existing.items()
+                                     if (user_id, guild_id) in current])
+        registry.mark_known(Member, created)
+        # bulk queries don't send signals
+        changed = [user_id for user_id, _ in new_keys] + [user_id for user_id, _ in stale + restored]
+        if changed:
+            memberships.invalidate(changed)
+
+    def _in_this_shard(self, guild_id):
+        shard_count = getattr(self.bot, 'shard_count', None)
+        if not shard_count or shard_count == 1:
+            return True
+        return (guild_id >> 22) % shard_count == self.bot.shard_id
+
+    def _mark_deleted(self, current):
+        left = [_id for _id in Guild.objects.filter(is_deleted=False).values_list('id', flat=True)
+                if _id not in current and self._in_this_shard(_id)]
+        for chunk in _chunks(left, self.chunk_size):
+            Guild.objects.filter(id__in=chunk).update(is_deleted=True)
+        if left:
+            print("Marked {} guilds the bot has left as deleted".format(len(left)))
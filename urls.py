@@ -2,9 +2,7 @@ from django.conf.urls import url, include
 from rest_framework.routers import DefaultRouter
 
 from . import views
-from .controllers import BaseController
-
-base = BaseController()
+from .controllers import get_installed_extensions
 
 router = DefaultRouter()
 
@@ -20,7 +18,7 @@ urlpatterns = [
 ]
 
 # link 'extension/' URLs to the extension's URLConfs
-extensions = base.get_extensions()
+extensions = get_installed_extensions()
 for extension in extensions:
     try:
         urlpatterns.append(url(r'^' + extension + r'/', include('dwarf.' + extension + '.urls')))
@@ -0,0 +1,53 @@
+"""Tracking when the rows of a model last changed."""
+
+import time
+import uuid
+
+from .cache import Cache
+
+
+class ModelVersions:
+    """Stores a version for every model in the cache that changes
+    whenever rows of the model are created, changed or deleted.
+    It is used to build ETags and to invalidate cached API responses.
+
+    Model signals bump versions automatically; code that writes rows
+    using bulk queries, which don't send signals, has to call :meth:`bump`.
+    """
+
+    def __init__(self):
+        self._cache = None
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            self._cache = Cache(extension='versions')
+        return self._cache
+
+    @staticmethod
+    def _key(model):
+        return model._meta.label_lower
+
+    def get(self, *models):
+        """Returns a dict mapping the given models to tuples of their version
+        (a str) and the time they last changed (a UNIX timestamp)."""
+
+        versions = self.cache.get_many([self._key(model) for model in models])
+        result = {}
+        for model in models:
+            version = versions.get(self._key(model))
+            if version is None:
+                # start versioning now, so the next change produces a new version
+                version = (uuid.uuid4().hex, time.time())
+                self.cache.set(self._key(model), version)
+            result[model] = version
+        return result
+
+    def bump(self, *models):
+        """Records that rows of the given models changed."""
+
+        now = time.time()
+        self.cache.set_many({self._key(model): (uuid.uuid4().hex, now) for model in models})
+
+
+model_versions = ModelVersions()
@@ -1,53 +1,75 @@
 from rest_framework import viewsets
 
+from .filters import GuildMembershipFilter
+from .mixins import BulkWriteMixin, ConditionalCacheMixin, SparseFieldsetMixin, StreamingListMixin
 from .models import Guild, Channel, Role, Member, Message, String
+from .pagination import SnowflakeCursorPagination
 from .permissions import (GuildPermissions, ChannelPermissions, RolePermissions,
                           MemberPermissions, MessagePermissions, StringPermissions)
 from .serializers import (GuildSerializer, ChannelSerializer, RoleSerializer,
                           MemberSerializer, MessageSerializer, StringSerializer)
 
 
-class GuildViewSet(viewsets.ModelViewSet):
+class GuildViewSet(BulkWriteMixin, ConditionalCacheMixin, SparseFieldsetMixin, StreamingListMixin,
+                   viewsets.ModelViewSet):
     """
     This viewset automatically provides `list`, `create`, `retrieve`,
-    `update` and `destroy` actions for the guild model.
+    `update` and `destroy` actions for the guild model, and a `bulk`
+    action that creates, updates or deletes many of them at once.
     """
     queryset = Guild.objects.all()
     serializer_class = GuildSerializer
     permission_classes = (GuildPermissions,)
+    pagination_class = SnowflakeCursorPagination
+    filter_backends = (GuildMembershipFilter,)
+    membership_field = 'id'
 
 
-class ChannelViewSet(viewsets.ModelViewSet):
+class ChannelViewSet(BulkWriteMixin, ConditionalCacheMixin, SparseFieldsetMixin, StreamingListMixin,
+                     viewsets.ModelViewSet):
     """
     This viewset automatically provides `list`, `create`, `retrieve`,
-    `update` and `destroy` actions for the channel model.
+    `update` and `destroy` actions for the channel model, and a `bulk`
+    action that creates, updates or deletes many of them at once.
     """
     queryset = Channel.objects.all()
     serializer_class = ChannelSerializer
     permission_classes = (ChannelPermissions,)
+    pagination_class = SnowflakeCursorPagination
 
 
-class RoleViewSet(viewsets.ModelViewSet):
+class RoleViewSet(BulkWriteMixin, ConditionalCacheMixin, SparseFieldsetMixin, StreamingListMixin,
+                  viewsets.ModelViewSet):
     """
     This viewset automatically provides `list`, `create`, `retrieve`,
-    `update` and `destroy` actions for the role model.
+    `update` and `destroy` actions for the role model, and a `bulk`
+    action that creates, updates or deletes many of them at once.
     """
     queryset = Role.objects.all()
     serializer_class = RoleSerializer
     permission_classes = (RolePermissions,)
+    pagination_class = SnowflakeCursorPagination
+    filter_backends = (GuildMembershipFilter,)
+    membership_field = 'guild_id'
 
 
-class MemberViewSet(viewsets.ModelViewSet):
+class MemberViewSet(BulkWriteMixin, ConditionalCacheMixin, SparseFieldsetMixin, StreamingListMixin,
+                    viewsets.ModelViewSet):
     """
     This viewset automatically provides `list`, `create`, `retrieve`,
-    `update` and `destroy` actions for the member model.
+    `update` and `destroy` actions for the member model, and a `bulk`
+    action that creates, updates or deletes many of them at once.
     """
     queryset = Member.objects.all()
     serializer_class = MemberSerializer
     permission_classes = (MemberPermissions,)
+    pagination_class = SnowflakeCursorPagination
+    filter_backends = (GuildMembershipFilter,)
+    membership_field = 'guild_id'
 
 
-class MessageViewSet(viewsets.ModelViewSet):
+class MessageViewSet(ConditionalCacheMixin, SparseFieldsetMixin, StreamingListMixin,
+                     viewsets.ModelViewSet):
     """
     This viewset automatically provides `list`, `create`, `retrieve`,
     `update` and `destroy` actions for the message model.
@@ -55,9 +77,11 @@ class MessageViewSet(viewsets.ModelViewSet):
     queryset = Message.objects.all()
     serializer_class = MessageSerializer
     permission_classes = (MessagePermissions,)
+    pagination_class = SnowflakeCursorPagination
 
 
-class StringViewSet(viewsets.ModelViewSet):
+class StringViewSet(ConditionalCacheMixin, SparseFieldsetMixin, StreamingListMixin,
+                    viewsets.ModelViewSet):
     """
     This viewset automatically provides `list`, `create`, `retrieve`,
     `update` and `destroy` actions for the string model.
@@ -65,3 +89,4 @@ class StringViewSet(viewsets.ModelViewSet):
     queryset = String.objects.all()
     serializer_class = StringSerializer
     permission_classes = (StringPermissions,)
+    pagination_class = SnowflakeCursorPagination